@@ -1,4 +1,7 @@
 from . import db
+from . import migrations
+from . import engines
 from .updating import MCHSUpdater
+from .reprocessing import MCHSReprocessor
 
-__all__ = ["db", "MCHSUpdater"]
+__all__ = ["db", "migrations", "engines", "MCHSUpdater", "MCHSReprocessor"]
@@ -0,0 +1,106 @@
+"""
+Pivot and contingency tables of news, aggregated by database instead of client.
+"""
+from typing import *
+
+from sqlalchemy.engine import URL
+from sqlalchemy.sql.expression import ColumnElement, Subquery
+from sqlalchemy import select, func, Integer, Float, Numeric, DateTime
+
+import pandas as pd
+
+from .analysis import NewsFilter, news_select, news_order
+from .engines import get_engine
+
+__all__ = ["DATE_BUCKETS", "AGGREGATES", "news_subquery", "can_aggregate", "pivot_table", "crosstab"]
+
+# Formats of date buckets for dialects without date_trunc
+DATE_BUCKETS = {
+    "day": "%Y-%m-%d",
+    "month": "%Y-%m-01",
+    "year": "%Y-01-01",
+}
+
+AGGREGATES = {
+    "mean": func.avg,
+    "sum": func.sum,
+    "min": func.min,
+    "max": func.max,
+    "count": func.count,
+}
+
+
+def news_subquery(columns: Iterable[str], limit: int = None, filters: NewsFilter = None,
+                  dialect: str = None) -> Subquery:
+    """
+    News columns, limited to the first news in news_order like read_dataframe.
+    """
+    query = news_select(list(dict.fromkeys(columns)))
+    if filters is not None and (condition := filters.condition()) is not None:
+        query = query.where(condition)
+    if limit is not None:
+        query = query.order_by(*news_order(dialect)).limit(limit)
+    return query.subquery("news")
+
+
+def can_aggregate(columns: Iterable[Optional[str]], values: Optional[str] = None) -> bool:
+    """
+    Whether table of columns (and numeric values) can be aggregated by database.
+    """
+    available = news_select().selected_columns
+    if not all(c is not None and c != "tags" and c in available for c in columns):
+        return False
+    return values is None or (values in available and isinstance(available[values].type, (Integer, Float, Numeric)))
+
+
+def _bucket(column: ColumnElement, dialect: str, bucket: str) -> ColumnElement:
+    if not isinstance(column.type, DateTime):
+        return column
+    if dialect == "postgresql":
+        return func.date_trunc(bucket, column).label(column.name)
+    if dialect in {"mysql", "mariadb"}:
+        return func.date_format(column, DATE_BUCKETS[bucket]).label(column.name)
+    return func.strftime(DATE_BUCKETS[bucket], column).label(column.name)
+
+
+def _grouped(url: URL, keys: List[str], values: List[str], value: Callable[[Subquery], ColumnElement],
+             limit: int = None, filters: NewsFilter = None, date_bucket: str = "day") -> pd.DataFrame:
+    engine = get_engine(url)
+    news = news_subquery(keys + values, limit, filters, engine.dialect.name)
+    groups = [_bucket(news.c[k], engine.dialect.name, date_bucket) for k in keys]
+    query = select(*groups, value(news).label("value")) \
+        .where(*(news.c[k].isnot(None) for k in keys)) \
+        .group_by(*groups)
+    with engine.connect() as con:
+        grouped = pd.read_sql(query, con)
+    for k in keys:
+        if isinstance(news.c[k].type, DateTime):
+            grouped[k] = pd.to_datetime(grouped[k])
+    return grouped
+
+
+def pivot_table(url: URL, values: str, index: str, columns: str, aggfunc: str = "mean", *,
+                limit: int = None, filters: NewsFilter = None, date_bucket: str = "day") -> pd.DataFrame:
+    """
+    Same as pd.pivot_table of news frame, with date columns bucketed.
+    :param aggfunc: one of AGGREGATES.
+    :param limit: aggregate only latest news.
+    :param filters: aggregate only matching news.
+    :param date_bucket: one of DATE_BUCKETS.
+    """
+    grouped = _grouped(url, [index, columns], [values], lambda news: AGGREGATES[aggfunc](news.c[values]),
+                       limit=limit, filters=filters, date_bucket=date_bucket)
+    return grouped.pivot(index=index, columns=columns, values="value").dropna(axis=1, how="all")
+
+
+def crosstab(url: URL, index: str, columns: str, *,
+             limit: int = None, filters: NewsFilter = None, date_bucket: str = "day") -> pd.DataFrame:
+    """
+    Same as pd.crosstab of news frame columns, with date columns bucketed.
+    :param limit: aggregate only latest news.
+    :param filters: aggregate only matching news.
+    :param date_bucket: one of DATE_BUCKETS.
+    """
+    grouped = _grouped(url, [index, columns], [], lambda news: func.count(),
+                       limit=limit, filters=filters, date_bucket=date_bucket)
+    return grouped.pivot(index=index, columns=columns, values="value").fillna(0).astype("int64")
@@ -1,47 +1,304 @@
-from sqlalchemy.engine import URL
-from sqlalchemy.orm import Session
-from sqlalchemy import create_engine
+from typing import *
 
+import datetime
+import logging
+
+from sqlalchemy.engine import Engine, URL
+from sqlalchemy.sql.expression import FunctionElement, Select, ColumnElement
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.types import TypeEngine
+from sqlalchemy import select, func, and_, or_, Text, String, Integer, Float, Numeric
+
+import numpy as np
 import pandas as pd
 
 from . import db
+from .engines import get_engine
+
+# Separator of aggregated tag names, not expected to be met in names themselves
+TAGS_SEPARATOR = '\x1f'
+
+
+class news_tag_names(FunctionElement):
+    """
+    Tag names of news with id, ordered by priority, in a single TAGS_SEPARATOR separated string.
+    Correlated subquery, so that only tags of selected news are aggregated.
+    """
+    name = "news_tag_names"
+    type = Text()
+    inherit_cache = True
+
+
+def _news_tags_from(element, compiler, **kw) -> Tuple[str, str, str]:
+    news_id, = element.clauses
+    news_tags = compiler.preparer.format_table(db.NewsTags.__table__)
+    tags = compiler.preparer.format_table(db.Tag.__table__)
+    return news_tags, tags, f"FROM {news_tags} JOIN {tags} ON {tags}.id = {news_tags}.tag_id " \
+                            f"WHERE {news_tags}.news_id = {compiler.process(news_id, **kw)}"
+
+
+@compiles(news_tag_names)
+def _compile_news_tag_names(element, compiler, **kw):
+    # SQLite group_concat follows order of rows in ordered subquery
+    news_tags, tags, source = _news_tags_from(element, compiler, **kw)
+    return f"(SELECT group_concat(name, '{TAGS_SEPARATOR}') " \
+           f"FROM (SELECT {tags}.name AS name {source} ORDER BY {news_tags}.priority) AS news_tag_names)"
+
+
+@compiles(news_tag_names, "mysql")
+@compiles(news_tag_names, "mariadb")
+def _compile_news_tag_names_mysql(element, compiler, **kw):
+    # Result is cut at group_concat_max_len, which is raised for engines on connect
+    news_tags, tags, source = _news_tags_from(element, compiler, **kw)
+    return f"(SELECT GROUP_CONCAT({tags}.name ORDER BY {news_tags}.priority SEPARATOR '{TAGS_SEPARATOR}') " \
+           f"{source})"
+
+
+@compiles(news_tag_names, "postgresql")
+def _compile_news_tag_names_postgresql(element, compiler, **kw):
+    news_tags, tags, source = _news_tags_from(element, compiler, **kw)
+    return f"(SELECT string_agg({tags}.name, '{TAGS_SEPARATOR}' ORDER BY {news_tags}.priority) {source})"
+
+
+def news_select(columns: Iterable[str] = None) -> Select:
+    """
+    Single query of all news with type specific columns joined and tag names aggregated.
+    Type specific columns with the same name in several tables (e.g. water) are coalesced.
+    :param columns: names of selected columns, all by default. Tables of not selected columns are not joined.
+    """
+    news = db.News.__table__
+    joins = {}
+    type_columns = {}
+    for mapper in db.News.__mapper__.self_and_descendants:
+        if (table := mapper.local_table) is not news:
+            for name in db.type_columns(mapper.class_):
+                type_columns.setdefault(name, []).append(table.c[name])
+
+    available = {("type" if col.name == "type_name" else col.name): col for col in news.columns}
+    available["tags"] = None
+    available.update(type_columns)
+    if columns is None:
+        columns = list(available.keys())
+    elif unknown := [name for name in columns if name not in available]:
+        raise ValueError(f"Unknown news columns {unknown}.")
+
+    selected = []
+    for name in columns:
+        if name == "tags":
+            selected.append(news_tag_names(news.c.id).label("tags"))
+        elif name in type_columns:
+            cols = type_columns[name]
+            for col in cols:
+                joins.setdefault(col.table.name, col.table)
+            selected.append(cols[0].label(name) if len(cols) == 1 else func.coalesce(*cols).label(name))
+        else:
+            col = available[name]
+            selected.append(col.label(name) if col.name != name else col)
+
+    source = news
+    for table in joins.values():
+        source = source.outerjoin(table, table.c.id == news.c.id)
+    return select(*selected).select_from(source)
+
+
+def news_columns() -> List[str]:
+    """
+    Names of all news_select columns.
+    """
+    return list(news_select().selected_columns.keys())
+
+
+# Large columns, not loaded unless requested explicitly
+DEFERRED_COLUMNS = ("text",)
+
+
+class NewsFilter(NamedTuple):
+    """
+    Conditions on news, None ones are not applied. Dates range is half-open: [date_from, date_to).
+    """
+    date_from: Optional[datetime.datetime] = None
+    date_to: Optional[datetime.datetime] = None
+    types: Optional[Sequence[str]] = None
+    regions: Optional[Sequence[str]] = None
+    categories: Optional[Sequence[str]] = None
 
+    def condition(self) -> Optional[ColumnElement]:
+        news = db.News.__table__
+        conditions = []
+        if self.date_from is not None:
+            conditions.append(news.c.date >= self.date_from)
+        if self.date_to is not None:
+            conditions.append(news.c.date < self.date_to)
+        if self.types is not None:
+            conditions.append(news.c.type_name.in_(list(self.types)))
+        if self.regions is not None:
+            conditions.append(news.c.region.in_(list(self.regions)))
+        if self.categories is not None:
+            categories = db.NewsCategories.__table__
+            conditions.append(news.c.id.in_(
+                select(categories.c.news_id).where(categories.c.category_name.in_(list(self.categories)))))
+        return and_(*conditions) if conditions else None
 
-def read_dataframe(url: URL, limit: int = None):
-    engine = create_engine(url)
-    with Session(engine) as s:
-        query_read = s.query(db.News)
-        if limit is not None:
-            query_read = query_read.limit(limit)
-        # Request news
-        news = pd.read_sql(query_read.statement, s.connection())
-        # Request tags
-        news_tags = pd.read_sql(
-            s.query(db.NewsTags).filter(db.NewsTags.news_id.in_(news['id'])).statement,
-            s.connection())
-        tags = pd.read_sql(
-            s.query(db.Tag).filter(db.Tag.id.in_(map(int, news_tags['tag_id'].unique()))).statement,
-            s.connection())
-        # Merge tags
-        news_tags = pd.merge(
-            news_tags, tags, how='left', left_on='tag_id', right_on='id', copy=False
-        ).groupby('news_id')['name'].apply(list)
-        news = pd.merge(
-            news, news_tags, how='left', left_on='id', right_on='news_id', copy=False
-        )
-        news.rename(columns={"name": "tags", "type_name": "type"}, inplace=True)
-
-        for subt in db.News.__subclasses__():
-            right = pd.read_sql(
-                s.query(subt).with_entities(
-                    *(set(subt.__mapper__.columns) - set(db.News.__mapper__.columns))
-                ).filter(subt.id.in_(news['id'])).statement,
-                s.connection())
-            news = pd.merge(news, right, how='left', left_on='id', right_on='id', copy=False)
-        # Postprocess
-        water_null = news['water_x'].isnull()
-        news.loc[water_null, ['water_x']] = news['water_y']
-        news.drop(columns='water_y', inplace=True)
-        news.rename(columns={"water_x": "water"}, inplace=True)
+
+# Date and id of the last news of page, next page starts after it
+PAGE_KEY = Tuple[Optional[datetime.datetime], int]
+
+
+def news_order(dialect: str) -> List[ColumnElement]:
+    """
+    Deterministic order of news, newest first and news without date last, served by date index.
+    """
+    news = db.News.__table__
+    date = news.c.date.desc()
+    # Other dialects sort NULL as the smallest value
+    if dialect == "postgresql":
+        date = date.nulls_last()
+    return [date, news.c.id.desc()]
+
+
+def after_condition(key: PAGE_KEY) -> ColumnElement:
+    """
+    News following key in news_order.
+    """
+    news = db.News.__table__
+    date, news_id = key
+    if date is None:
+        return and_(news.c.date.is_(None), news.c.id < news_id)
+    return or_(news.c.date < date, and_(news.c.date == date, news.c.id < news_id), news.c.date.is_(None))
+
+
+def page_key(news: pd.DataFrame) -> Optional[PAGE_KEY]:
+    """
+    Key of the last news of frame, loaded in news_order.
+    """
+    if not len(news):
+        return None
+    last = news.iloc[-1]
+    return None if pd.isna(last['date']) else pd.Timestamp(last['date']).to_pydatetime(), int(last['id'])
+
+
+INTEGER_DTYPES = ("Int8", "Int16", "Int32", "Int64")
+
+
+def _compact_integers(column: pd.Series) -> pd.Series:
+    values = column.dropna()
+    if not len(values):
+        return column.astype(INTEGER_DTYPES[0])
+    low, high = values.min(), values.max()
+    for dtype in INTEGER_DTYPES:
+        info = np.iinfo(dtype.lower())
+        if info.min <= low and high <= info.max:
+            return column.astype(dtype)
+    return column.astype(INTEGER_DTYPES[-1])
+
+
+def compact(news: pd.DataFrame, types: Mapping[str, TypeEngine] = None) -> pd.DataFrame:
+    """
+    Convert columns of news frame to memory-compact dtypes:
+    categories for short strings (type, region, ...), smallest nullable integers for counts,
+    Arrow-backed strings for texts. Tags stay lists of names.
+    :param types: SQL types of columns, news_select ones by default.
+    """
+    if types is None:
+        types = {name: col.type for name, col in news_select().selected_columns.items()}
+    news = news.copy()
+    for name in news.columns:
+        if name == "tags" or (t := types.get(name, None)) is None:
+            continue
+        if isinstance(t, Integer):
+            news[name] = _compact_integers(news[name])
+        elif isinstance(t, (Float, Numeric)):
+            news[name] = news[name].astype("Float32")
+        elif isinstance(t, String) and not isinstance(t, Text) and t.length is not None:
+            news[name] = news[name].astype("category")
+        elif isinstance(t, String):
+            news[name] = news[name].astype("string[pyarrow]")
+    return news
+
+
+def memory_footprint(frame: pd.DataFrame) -> pd.Series:
+    """
+    Bytes used by index and every column of frame, including referenced Python objects, and their total.
+    """
+    usage = frame.memory_usage(deep=True)
+    return pd.concat([usage, pd.Series({"total": usage.sum()})])
+
+
+def _convert(news: pd.DataFrame, types: Mapping[str, TypeEngine]) -> pd.DataFrame:
+    if "tags" in news.columns:
+        news['tags'] = news['tags'].str.split(TAGS_SEPARATOR)
     # news.set_index('id', inplace=True)
-    return news.convert_dtypes()
+    news = compact(news, types)
+    # Deep memory usage walks every Python object of frame
+    if (logger := logging.getLogger("Analysis")).isEnabledFor(logging.DEBUG):
+        logger.debug(f"Loaded {len(news)} news, {memory_footprint(news)['total'] / 2 ** 20:.1f} MiB")
+    return news
+
+
+def _read_chunks(engine: Engine, query: Select, chunksize: int, stream_results: bool) -> Iterator[pd.DataFrame]:
+    types = {name: col.type for name, col in query.selected_columns.items()}
+    with engine.connect() as con:
+        if stream_results:
+            con = con.execution_options(stream_results=True)
+        for chunk in pd.read_sql(query, con, chunksize=chunksize):
+            yield _convert(chunk, types)
+
+
+# Rows per chunk of loading with progress
+PROGRESS_CHUNKSIZE = 10000
+
+
+def read_dataframe(url: URL, limit: int = None, *, where: ColumnElement = None,
+                   filters: NewsFilter = None,
+                   after: PAGE_KEY = None,
+                   columns: Iterable[str] = None,
+                   chunksize: int = None,
+                   stream_results: bool = None,
+                   progress: Callable[[int], Any] = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Frame of news with compact dtypes (see compact()) in news_order.
+    :param limit: number of first news, e.g. page size.
+    :param where: additional condition on news_select columns.
+    :param filters: conditions applied by database.
+    :param after: key of the last news of previous page (see page_key), news after it are loaded.
+    :param columns: loaded columns, all except DEFERRED_COLUMNS by default.
+    :param chunksize: return iterator of frames with at most chunksize rows.
+        Categories and integer dtypes of chunks may differ.
+    :param stream_results: fetch rows with server-side cursor, by default only when reading chunks.
+    :param progress: called with number of loaded rows after every PROGRESS_CHUNKSIZE rows,
+        exception raised by it stops loading. Not called when reading chunks.
+    """
+    if columns is None:
+        columns = [name for name in news_columns() if name not in DEFERRED_COLUMNS]
+    engine = get_engine(url)
+    query = news_select(columns)
+    if where is not None:
+        query = query.where(where)
+    if filters is not None and (condition := filters.condition()) is not None:
+        query = query.where(condition)
+    if after is not None:
+        query = query.where(after_condition(after))
+    query = query.order_by(*news_order(engine.dialect.name))
+    if limit is not None:
+        query = query.limit(limit)
+    if stream_results is None:
+        stream_results = chunksize is not None or progress is not None
+    if chunksize is not None:
+        return _read_chunks(engine, query, chunksize, stream_results)
+    types = {name: col.type for name, col in query.selected_columns.items()}
+    if progress is not None:
+        chunks = []
+        rows = 0
+        for chunk in _read_chunks(engine, query, PROGRESS_CHUNKSIZE, stream_results):
+            chunks.append(chunk)
+            rows += len(chunk)
+            progress(rows)
+        if not chunks:
+            return _convert(pd.DataFrame(columns=list(types.keys())), types)
+        # Categories and integer dtypes of chunks may differ
+        return compact(pd.concat(chunks, ignore_index=True), types)
+    with engine.connect() as con:
+        if stream_results:
+            con = con.execution_options(stream_results=True)
+        news = pd.read_sql(query, con)
+    return _convert(news, types)
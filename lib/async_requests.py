@@ -15,6 +15,7 @@ class RequestManager(TaskManager):
     Class for making asynchronous url requests.
     """
     _session: aiohttp.ClientSession = None
+    _session_closing: Optional[asyncio.Task] = None
     close_session: bool = True
 
     class RequestTask(TaskManager.AsyncTask):
@@ -136,7 +137,14 @@ class RequestManager(TaskManager):
 
     def _close_session(self):
         if not self._session.closed:
-            self.loop.create_task(self._session.close(), name="session.close")
+            self._session_closing = self.loop.create_task(self._session.close(), name="session.close")
+
+    async def finish_all(self):
+        await super().finish_all()
+        # Session is closed by all_finished after the last task, before the loop is stopped by run_all
+        if (closing := self._session_closing) is not None:
+            self._session_closing = None
+            await closing
 
     def all_finished(self):
         if self.close_session:
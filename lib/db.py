@@ -2,19 +2,21 @@
 SQLAlchemy database mappings
 """
 from typing import List
+import typing
 
 from sqlalchemy.event import listens_for
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.engine import Connection
-from sqlalchemy import MetaData, Table, Column, ForeignKey, Integer, String, Text, DateTime
+from sqlalchemy import MetaData, Table, Column, ForeignKey, Index, Integer, BigInteger, String, Text, Date, DateTime
 
 __all__ = ["Base",
            "News",
            "Fire", "Traffic", "Rescue", "Drown", "Flood",
            "Category", "Tag", "Type",
            "NewsCategories", "NewsTags",
-           "ExistingNews"]
+           "ExistingNews", "ProcessedNews", "SchemaVersion", "NewsRollup",
+           "type_columns"]
 
 Base = declarative_base()
 
@@ -22,9 +24,13 @@ Base = declarative_base()
 class News(Base):
     __tablename__ = "news"
 
-    __table_args__ = {
-        "comment": "General news table with all data, directly retrieved from HTML pages and discriminator type column"
-    }
+    __table_args__ = (
+        Index("ix_news_date", "date"),
+        Index("ix_news_type_name_date", "type_name", "date"),
+        Index("ix_news_region", "region"),
+        Index("ix_news_city", "city"),
+        {"comment": "General news table with all data, directly retrieved from HTML pages and discriminator type column"}
+    )
 
     id = Column(Integer, primary_key=True)
     date = Column(DateTime)
@@ -124,6 +130,47 @@ class ExistingNews(Base):
                         viewonly=True)
 
 
+class ProcessedNews(Base):
+    __tablename__ = "__processed_news"
+    __table_args__ = {
+        "comment": "Service table, version of text processor that derived news fields from text."
+    }
+
+    id = Column(Integer, ForeignKey(News.id, ondelete="CASCADE"), primary_key=True)
+    version = Column(String(32))
+    processed = Column(DateTime)
+
+
+class SchemaVersion(Base):
+    __tablename__ = "__schema_version"
+    __table_args__ = {
+        "comment": "Service table, applied schema migrations."
+    }
+
+    version = Column(Integer, primary_key=True)
+    description = Column(Text)
+    applied = Column(DateTime)
+
+
+class NewsRollup(Base):
+    __tablename__ = "__news_rollups"
+    __table_args__ = {
+        "comment": "Service table, news counts and sums per day, week and month by type and region."
+    }
+
+    grain = Column(String(5), primary_key=True)
+    # First day of period
+    period = Column(Date, primary_key=True)
+    type_name = Column(String(25), primary_key=True)
+    # Empty string for news without region
+    region = Column(String(50), primary_key=True)
+    news = Column(Integer, nullable=False)
+    injuries = Column(BigInteger, nullable=False)
+    n_staff = Column(BigInteger, nullable=False)
+    n_tech = Column(BigInteger, nullable=False)
+    area = Column(BigInteger, nullable=False)
+
+
 class Type(Base):
     __tablename__ = "types"
 
@@ -151,6 +198,7 @@ class Category(Base):
 
 class NewsCategories(Base):
     __tablename__ = "news__categories"
+    __table_args__ = (Index("ix_news__categories_category_name", "category_name"),)
 
     news_id = Column(Integer, ForeignKey(News.id, ondelete="CASCADE"), primary_key=True)
     news = relationship(News, back_populates="categories_assoc")
@@ -179,6 +227,7 @@ class Tag(Base):
 
 class NewsTags(Base):
     __tablename__ = "news__tags"
+    __table_args__ = (Index("ix_news__tags_tag_id", "tag_id"),)
 
     news_id = Column(Integer, ForeignKey(News.id, ondelete="CASCADE"), primary_key=True)
     news = relationship(News, back_populates="tags_assoc")
@@ -190,6 +239,15 @@ class NewsTags(Base):
         return f"{self.__class__.__name__}(news_id={self.news_id}, tag_id={self.tag_id}, priority={self.priority})"
 
 
+def type_columns(cls: typing.Type[News]) -> List[str]:
+    """
+    Names of columns in own table of News subclass.
+    """
+    if (table := cls.__table__) is News.__table__:
+        return []
+    return [col.name for col in table.columns if col.name != "id"]
+
+
 @listens_for(Base.metadata, "after_create")
 def create_types(metadata: MetaData, con: Connection, tables: List[Table] = (), **kwargs):
     type_names = set()
@@ -0,0 +1,47 @@
+"""
+Database calls from event loop, executed in a dedicated thread.
+"""
+from typing import *
+
+import asyncio
+import functools
+import concurrent.futures
+
+__all__ = ["DBWorker"]
+
+T = TypeVar("T")
+
+
+class DBWorker:
+    """
+    Dedicated thread for blocking database calls, so that event loop keeps serving network requests meanwhile.
+    Calls are executed one by one in order of submission, their results are awaited on the loop.
+    Number of submitted and not finished calls is bounded by max_pending,
+    so submitting coroutines (and therefore fetching) are slowed down when database falls behind.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_pending: int = 4):
+        self.loop = loop
+        self._slots = asyncio.BoundedSemaphore(max_pending)
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="DBWorker")
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Wait for free slot, then execute func in database thread and await its result.
+        """
+        async with self._slots:
+            return await self.loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop database thread after all submitted calls are executed. It is restarted on next call.
+        """
+        if (executor := self._executor) is not None:
+            self._executor = None
+            executor.shutdown(wait=wait)
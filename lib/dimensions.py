@@ -0,0 +1,73 @@
+"""
+In-process cache of small, slowly growing dimension tables (types, categories, tags).
+"""
+from typing import *
+
+import threading
+
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy import Table
+
+from .upserts import upsert
+
+__all__ = ["DimensionCache"]
+
+
+class DimensionCache:
+    """
+    Shared write-through cache of dimension row keys known to be present in database.
+    Only rows never seen before are upserted, all others are skipped without round trips.
+    Keys are cached optimistically when inserted inside writer's transaction,
+    so cache should be refreshed whenever such transaction fails (e.g. on integrity error).
+    Key sets are guarded by lock, database requests are made outside of it.
+    """
+    _caches: Dict[str, "DimensionCache"] = {}
+    _caches_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, engine: Engine) -> "DimensionCache":
+        """
+        Cache shared by all engines with the same URL.
+        """
+        with cls._caches_lock:
+            if (cache := cls._caches.get(key := str(engine.url), None)) is None:
+                cache = cls._caches[key] = cls()
+            return cache
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known: Dict[str, Set[Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.upserts = 0
+        self.refreshes = 0
+
+    def ensure(self, con: Connection, table: Table, rows: Dict[Any, Dict[str, Any]]):
+        """
+        Upsert rows, which are not known to be present in database.
+        :param rows: primary key value -> row dict.
+        """
+        with self._lock:
+            known = self._known.setdefault(table.name, set())
+            missing = {k: row for k, row in rows.items() if k not in known}
+            self.hits += len(rows) - len(missing)
+            self.misses += len(missing)
+        if not missing:
+            return
+        upsert(con, table, missing.values())
+        with self._lock:
+            self._known.setdefault(table.name, set()).update(missing.keys())
+            self.upserts += len(missing)
+
+    def refresh(self):
+        """
+        Forget all known keys, so they are checked against database again.
+        """
+        with self._lock:
+            self._known.clear()
+            self.refreshes += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "upserts": self.upserts, "refreshes": self.refreshes,
+                    **{f"known_{name}": len(keys) for name, keys in self._known.items()}}
@@ -0,0 +1,167 @@
+"""
+Process-wide registry of SQLAlchemy engines, shared by all database users of the same URL.
+"""
+from typing import *
+
+import time
+import threading
+
+from sqlalchemy.engine import Engine, URL, make_url
+from sqlalchemy.event import listen
+from sqlalchemy import create_engine
+
+__all__ = ["POOL_SIZE", "MAX_OVERFLOW", "POOL_RECYCLE", "IDLE_TIMEOUT", "GROUP_CONCAT_MAX_LEN",
+           "normalize_url", "get_engine", "check_engine", "dispose_idle", "dispose_all", "stats"]
+
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+# Seconds before pooled connection is reconnected, should be less than server-side timeout
+POOL_RECYCLE = 60 * 60
+# Seconds without checkouts before pool of engine is disposed by dispose_idle
+IDLE_TIMEOUT = 10 * 60
+# Length of GROUP_CONCAT results (e.g. aggregated tag names) in MySQL sessions, 1024 bytes by default
+GROUP_CONCAT_MAX_LEN = 2 ** 32 - 1
+
+
+class _EngineRecord:
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.last_used = time.monotonic()
+        self.checked_out = 0
+        # Pool has connections opened since creation or last disposal
+        self.connected = False
+        self.stats = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0, "disposals": 0}
+
+    def on_connect(self, *args):
+        self.stats["connects"] += 1
+        self.connected = True
+
+    def on_checkout(self, *args):
+        self.stats["checkouts"] += 1
+        self.checked_out += 1
+        self.last_used = time.monotonic()
+
+    def on_checkin(self, *args):
+        self.stats["checkins"] += 1
+        self.checked_out = max(self.checked_out - 1, 0)
+        self.last_used = time.monotonic()
+
+    def on_invalidate(self, *args):
+        self.stats["invalidations"] += 1
+
+
+_records: Dict[str, _EngineRecord] = {}
+_lock = threading.Lock()
+
+
+def normalize_url(url: Union[str, URL]) -> str:
+    """
+    Registry key of URL, same for URLs differing only in driver name or host case.
+    """
+    url = make_url(url)
+    url = url.set(drivername=url.drivername.lower(), host=url.host.lower() if url.host else url.host)
+    return url.render_as_string(hide_password=False)
+
+
+def _set_group_concat_max_len(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"SET SESSION group_concat_max_len = {GROUP_CONCAT_MAX_LEN}")
+    cursor.close()
+
+
+def _create_engine(url: URL) -> Engine:
+    kwargs = {"pool_pre_ping": True}
+    if url.get_backend_name() != "sqlite":
+        kwargs.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_recycle=POOL_RECYCLE)
+    engine = create_engine(url, **kwargs)
+    if url.get_backend_name() in {"mysql", "mariadb"}:
+        listen(engine, "connect", _set_group_concat_max_len)
+    return engine
+
+
+def _create_record(url: Union[str, URL]) -> _EngineRecord:
+    engine = _create_engine(make_url(url))
+    record = _EngineRecord(engine)
+    listen(engine, "connect", record.on_connect)
+    listen(engine, "checkout", record.on_checkout)
+    listen(engine, "checkin", record.on_checkin)
+    listen(engine, "invalidate", record.on_invalidate)
+    return record
+
+
+def get_engine(url: Union[str, URL]) -> Engine:
+    """
+    Engine registered for URL, created with pre-ping and pool sizing on first request.
+    """
+    key = normalize_url(url)
+    with _lock:
+        if (record := _records.get(key, None)) is None:
+            record = _records[key] = _create_record(url)
+        return record.engine
+
+
+def check_engine(url: Union[str, URL]) -> Engine:
+    """
+    Engine for URL, registered only after a successful test connection,
+    so that engines of failed attempts (e.g. with wrong password) don't stay in registry.
+    Registered engine, which has never connected, is disposed and unregistered if connection fails.
+    """
+    key = normalize_url(url)
+    with _lock:
+        record = _records.get(key, None)
+    registered = record is not None
+    if not registered:
+        record = _create_record(url)
+    try:
+        with record.engine.connect():
+            pass
+    except BaseException:
+        if not record.stats["connects"]:
+            with _lock:
+                if _records.get(key, None) is record:
+                    del _records[key]
+            record.engine.dispose()
+        raise
+    if not registered:
+        with _lock:
+            if (existing := _records.get(key, None)) is not None:
+                # Registered by other thread meanwhile
+                record.engine.dispose()
+                return existing.engine
+            _records[key] = record
+    return record.engine
+
+
+def dispose_idle(max_idle: float = IDLE_TIMEOUT) -> int:
+    """
+    Close pooled connections of engines unused for max_idle seconds.
+    Engines stay registered and reconnect on next use.
+    :return: number of disposed engines.
+    """
+    now = time.monotonic()
+    with _lock:
+        idle = [r for r in _records.values()
+                if r.connected and not r.checked_out and now - r.last_used >= max_idle]
+    for record in idle:
+        record.engine.dispose()
+        record.connected = False
+        record.stats["disposals"] += 1
+    return len(idle)
+
+
+def dispose_all():
+    with _lock:
+        records = list(_records.values())
+    for record in records:
+        record.engine.dispose()
+        record.connected = False
+        record.stats["disposals"] += 1
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """
+    Connection counters of every registered engine, keyed by URL with hidden password.
+    """
+    with _lock:
+        return {repr(r.engine.url): {**r.stats, "checked_out": r.checked_out} for r in _records.values()}
@@ -0,0 +1,130 @@
+"""
+Local columnar cache of analysis news frames, refreshed incrementally.
+"""
+from typing import *
+
+import os
+import json
+import hashlib
+import datetime
+
+from sqlalchemy.engine import URL
+from sqlalchemy import inspect, select, func, or_
+
+import pandas as pd
+import pyarrow
+import pyarrow.feather
+
+import utils
+
+from . import db
+from .analysis import read_dataframe, compact
+from .engines import get_engine
+
+__all__ = ["FrameCache"]
+
+
+class FrameCache:
+    """
+    Per-schema Feather (Arrow IPC) file with news frame, read into memory on load.
+    Refresh requests only news with id or date newer than cached ones
+    and news written (or reprocessed) by updater since last refresh, and merges them into cached frame.
+    News are taken as written since last refresh, if their processing time is later than the latest one
+    seen by it. News stamped with exactly the seen time are taken as fetched, as writers stamp the whole batch
+    with a single time in its transaction, which was committed when the time was read.
+    Only another batch, stamped with the same time (e.g. second precision of MySQL) and committed later, is missed.
+    News deleted from database stay in cache until .clear().
+    Frames with different column projections are cached in separate files.
+    """
+
+    def __init__(self, url: URL, directory: str = utils.PATH.CACHE, *, columns: Sequence[str] = None):
+        """
+        :param columns: cached columns (id and date are always included), see read_dataframe.
+        """
+        self.url = url
+        self.columns = None if columns is None else list(dict.fromkeys(["id", "date", *columns]))
+        key = hashlib.md5(repr((url, self.columns)).encode("utf8")).hexdigest()[:12]
+        name = f"{url.database}-{key}"
+        self.path = os.path.join(directory, f"{name}.feather")
+        self.meta_path = os.path.join(directory, f"{name}.json")
+
+    def _load_meta(self) -> Optional[Dict[str, Any]]:
+        if not (os.path.isfile(self.path) and os.path.isfile(self.meta_path)):
+            return None
+        with open(self.meta_path, mode='r') as f:
+            meta = json.load(f)
+        for k in ("max_date", "since"):
+            if meta.get(k, None) is not None:
+                meta[k] = datetime.datetime.fromisoformat(meta[k])
+        return meta
+
+    def load(self) -> Optional[pd.DataFrame]:
+        """
+        Cached frame without refreshing, None if nothing is cached.
+        """
+        if self._load_meta() is None:
+            return None
+        table = pyarrow.feather.read_table(self.path)
+        frame = table.to_pandas()
+        # Arrow list columns (tags) are converted to ndarrays, frames of read_dataframe have lists
+        for field in table.schema:
+            if pyarrow.types.is_list(field.type):
+                frame[field.name] = pd.Series(table.column(field.name).to_pylist(), index=frame.index, dtype=object)
+        return frame
+
+    def save(self, frame: pd.DataFrame, meta: Dict[str, Any]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        pyarrow.feather.write_feather(frame.reset_index(drop=True), tmp)
+        os.replace(tmp, self.path)
+        with open(self.meta_path, mode='w') as f:
+            json.dump({k: v.isoformat() if isinstance(v, datetime.datetime) else v for k, v in meta.items()}, f)
+
+    def clear(self):
+        for path in (self.path, self.meta_path):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def refresh(self, progress: Callable[[int], Any] = None) -> pd.DataFrame:
+        """
+        Merge news, new or changed since last refresh, into cached frame and save it.
+        :param progress: called with number of loaded news, see read_dataframe.
+        """
+        news = db.News.__table__
+        processed = db.ProcessedNews.__table__
+        with get_engine(self.url).connect() as con:
+            # Service table is missing in schemas created before processor versioning and not updated since
+            tracked = inspect(con).has_table(processed.name)
+            # Latest processing time, stamped by writers with their clock, read before news,
+            # so that writes committed during reading are fetched on next refresh
+            since = con.execute(select(func.max(processed.c.processed))).scalar() if tracked else None
+
+        meta = self._load_meta()
+        if meta is None:
+            frame = read_dataframe(self.url, columns=self.columns, progress=progress)
+        else:
+            cached = self.load()
+            conditions = []
+            if meta.get("max_id", None) is not None:
+                conditions.append(news.c.id > meta["max_id"])
+            if meta.get("max_date", None) is not None:
+                conditions.append(news.c.date > meta["max_date"])
+            if tracked and meta.get("since", None) is not None:
+                conditions.append(news.c.id.in_(select(processed.c.id).where(processed.c.processed > meta["since"])))
+            delta = read_dataframe(self.url, columns=self.columns, where=or_(*conditions) if conditions else None,
+                                   progress=progress)
+            if conditions:
+                # Categories and integer dtypes of delta may differ from cached ones
+                frame = compact(pd.concat([cached[~cached['id'].isin(delta['id'])], delta], ignore_index=True))
+            else:
+                frame = delta
+        if not len(frame):
+            return frame
+
+        self.save(frame, {
+            "max_id": int(frame['id'].max()),
+            "max_date": None if pd.isna(d := frame['date'].max()) else d.to_pydatetime(),
+            "since": since,
+            "rows": len(frame),
+        })
+        return frame
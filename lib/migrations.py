@@ -0,0 +1,152 @@
+"""
+Versioned migrations of schemas, created by earlier versions of database mappings.
+"""
+from typing import *
+
+import time
+import datetime
+
+from sqlalchemy.event import listens_for
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy import MetaData, Table, Index, inspect, select, func, text
+
+from .date_utils import MCHS_TZ
+from . import rollups, search
+from .db import *
+
+__all__ = ["Migration", "MIGRATIONS", "create_missing_indexes",
+           "schema_version", "pending_migrations", "migrate", "benchmark"]
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable[[Connection], Any]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(description: str):
+    """
+    Register decorated function as the next schema migration.
+    Migrations should be idempotent, as schemas created with older mappings might already be partially migrated.
+    """
+
+    def decorator(upgrade: Callable[[Connection], Any]):
+        MIGRATIONS.append(Migration(len(MIGRATIONS) + 1, description, upgrade))
+        return upgrade
+
+    return decorator
+
+
+def create_index(con: Connection, index: Index):
+    """
+    Create index without locking table for writes where dialect supports it.
+    """
+    if con.dialect.name in {"mysql", "mariadb"}:
+        con.execute(text(f"{CreateIndex(index).compile(dialect=con.dialect)} ALGORITHM=INPLACE LOCK=NONE"))
+    else:
+        index.create(con)
+
+
+def create_missing_indexes(con: Connection, tables: Iterable[Table]):
+    insp = inspect(con)
+    for table in tables:
+        existing = {index["name"] for index in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                create_index(con, index)
+
+
+@migration("Add processed news service table")
+def _add_processed_news(con: Connection):
+    ProcessedNews.__table__.create(con, checkfirst=True)
+
+
+@migration("Add date, type, region, city, category and tag indexes")
+def _add_access_indexes(con: Connection):
+    create_missing_indexes(con, (News.__table__, NewsCategories.__table__, NewsTags.__table__))
+
+
+@migration("Add news rollups table")
+def _add_rollups(con: Connection):
+    NewsRollup.__table__.create(con, checkfirst=True)
+    # Table might have been created empty by metadata create_all
+    rollups.rebuild(con)
+
+
+@migration("Add full-text index of news title and text")
+def _add_search_index(con: Connection):
+    search.create_search_index(con)
+
+
+def schema_version(engine: Engine) -> int:
+    with engine.connect() as con:
+        if not inspect(con).has_table(SchemaVersion.__tablename__):
+            return 0
+        return con.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+    version = schema_version(engine)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def migrate(engine: Engine) -> List[Migration]:
+    """
+    Apply all pending migrations, each in its own transaction.
+    :return: applied migrations.
+    """
+    SchemaVersion.__table__.create(engine, checkfirst=True)
+    applied = []
+    for m in pending_migrations(engine):
+        with engine.begin() as con:
+            m.upgrade(con)
+            con.execute(SchemaVersion.__table__.insert(),
+                        {"version": m.version, "description": m.description,
+                         "applied": datetime.datetime.now(tz=MCHS_TZ)})
+        applied.append(m)
+    return applied
+
+
+@listens_for(Base.metadata, "after_create")
+def stamp_version(metadata: MetaData, con: Connection, tables: List[Table] = (), **kwargs):
+    """
+    Schemas created from scratch with current mappings need no migrations.
+    """
+    if News.__table__ in tables and MIGRATIONS:
+        m = MIGRATIONS[-1]
+        with con.begin():
+            con.execute(SchemaVersion.__table__.insert(),
+                        {"version": m.version, "description": m.description,
+                         "applied": datetime.datetime.now(tz=MCHS_TZ)})
+
+
+def benchmark(engine: Engine, repeat: int = 3) -> Dict[str, float]:
+    """
+    Best of repeat timings (seconds) of queries on indexed access paths, for comparison before and after migration.
+    """
+    month_ago = datetime.datetime.now(tz=MCHS_TZ) - datetime.timedelta(days=30)
+    queries = {
+        "last date": select(func.max(News.date)),
+        "last month": select(func.count()).select_from(News.__table__).where(News.date >= month_ago),
+        "by type": select(News.type_name, func.count()).group_by(News.type_name),
+        "by region": select(News.region, func.count()).group_by(News.region),
+        "by city": select(News.city, func.count()).group_by(News.city),
+        "by tag": select(func.count()).select_from(NewsTags.__table__).where(
+            NewsTags.tag_id == select(func.min(Tag.id)).scalar_subquery()),
+    }
+    timings = {}
+    with engine.connect() as con:
+        for name, query in queries.items():
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                con.execute(query).all()
+                t = time.perf_counter() - start
+                if best is None or t < best:
+                    best = t
+            timings[name] = best
+    return timings
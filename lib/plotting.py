@@ -0,0 +1,159 @@
+"""
+Plotting of large tables: binning and downsampling before figures are serialized.
+"""
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+import plotly
+import plotly.express
+import plotly.graph_objects as go
+
+__all__ = ["AGGREGATE_THRESHOLD", "WEBGL_THRESHOLD", "BINS", "LINE_POINTS",
+           "lttb", "figure"]
+
+# Rows of table, above which histograms, density plots and lines are aggregated
+AGGREGATE_THRESHOLD = 10000
+# Points of scatter and line plots, above which they are drawn with WebGL
+WEBGL_THRESHOLD = 5000
+# Bins of histograms and every axis of density plots
+BINS = 100
+# Points of downsampled line plots, divided between lines
+LINE_POINTS = 4000
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling of line with x-sorted points.
+    :return: indices of n_out selected points, including the first and the last ones.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # Boundaries of n_out - 2 buckets between the first and the last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (end, edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _is_continuous(column: pd.Series) -> bool:
+    return (pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column)) \
+        or pd.api.types.is_datetime64_any_dtype(column)
+
+
+def _as_float(column: pd.Series) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return pd.DatetimeIndex(column).asi8.astype(np.float64)
+    return column.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _from_float(values: np.ndarray, like: pd.Series):
+    if pd.api.types.is_datetime64_any_dtype(like):
+        return pd.to_datetime(values.astype(np.int64))
+    return values
+
+
+def _groups(table: pd.DataFrame, by: List[str]) -> Iterator[Tuple[Dict[str, Any], pd.DataFrame]]:
+    if not by:
+        yield {}, table
+        return
+    for key, group in table.groupby(by, observed=True, sort=False):
+        yield dict(zip(by, key if isinstance(key, tuple) else (key,))), group
+
+
+def _histogram(table: pd.DataFrame, x: str, color: Optional[str]) -> go.Figure:
+    values = table[x].dropna()
+    edges = np.histogram_bin_edges(_as_float(values), bins=BINS)
+    centers = (edges[:-1] + edges[1:]) / 2
+    bins = []
+    for key, group in _groups(table.dropna(subset=[x]), [color] if color else []):
+        counts, _ = np.histogram(_as_float(group[x]), bins=edges)
+        bins.append(pd.DataFrame({x: _from_float(centers, values), "count": counts, **key}))
+    fig = plotly.express.bar(pd.concat(bins, ignore_index=True), x=x, y="count", color=color)
+    width = edges[1] - edges[0]
+    # Bar width of date axis is in milliseconds
+    fig.update_traces(width=width / 1e6 if pd.api.types.is_datetime64_any_dtype(values) else width)
+    fig.update_layout(bargap=0, barmode="stack")
+    return fig
+
+
+def _density(table: pd.DataFrame, x: str, y: str, contour: bool) -> go.Figure:
+    table = table.dropna(subset=[x, y])
+    counts, x_edges, y_edges = np.histogram2d(_as_float(table[x]), _as_float(table[y]), bins=BINS)
+    trace = go.Contour if contour else go.Heatmap
+    fig = go.Figure(trace(z=counts.T,
+                          x=_from_float((x_edges[:-1] + x_edges[1:]) / 2, table[x]),
+                          y=_from_float((y_edges[:-1] + y_edges[1:]) / 2, table[y]),
+                          colorscale="Viridis"))
+    fig.update_layout(xaxis_title=x, yaxis_title=y)
+    return fig
+
+
+def _downsampled(table: pd.DataFrame, x: str, y: str, by: List[str]) -> pd.DataFrame:
+    table = table.dropna(subset=[x, y])
+    groups = list(_groups(table, by))
+    n_out = max(LINE_POINTS // max(len(groups), 1), 3)
+    parts = []
+    for key, group in groups:
+        group = group.sort_values(x, kind="stable")
+        parts.append(group.iloc[lttb(_as_float(group[x]), _as_float(group[y]), n_out)])
+    return pd.concat(parts) if parts else table
+
+
+def _mark_aggregated(fig: go.Figure, note: str):
+    fig.add_annotation(text=note, xref="paper", yref="paper", x=1, y=1.02,
+                       xanchor="right", yanchor="bottom", showarrow=False, font={"size": 10, "color": "gray"})
+
+
+def figure(table: pd.DataFrame, kind: str, **kwargs) -> Tuple[go.Figure, Optional[str]]:
+    """
+    Figure of table like plotly.plot (pandas backend of plotly) with kind of plot and its arguments.
+    Large tables are binned (histograms, density plots) or downsampled (lines, areas),
+    large scatter and line plots are drawn with WebGL.
+    :return: figure and description of aggregation, None if table is plotted as is.
+    """
+    kwargs = {k: v for k, v in kwargs.items() if v is not None}
+    x, y, color = kwargs.get("x", None), kwargs.get("y", None), kwargs.get("color", None)
+    n = len(table)
+    large = n > AGGREGATE_THRESHOLD
+    fig, note = None, None
+
+    if large and kind == "histogram" and x is not None and y is None and _is_continuous(table[x]):
+        fig, note = _histogram(table, x, color), f"{n} rows binned into {BINS} bins"
+    elif large and kind in {"density_heatmap", "density_contour"} and x is not None and y is not None \
+            and color is None and _is_continuous(table[x]) and _is_continuous(table[y]):
+        fig = _density(table, x, y, contour=kind == "density_contour")
+        note = f"{n} rows binned into {BINS}x{BINS} bins"
+    elif large and kind in {"line", "area"} and x is not None and y is not None \
+            and _is_continuous(table[x]) and _is_continuous(table[y]):
+        by = [k for k in (color, kwargs.get("line_group", None)) if k is not None]
+        sampled = _downsampled(table, x, y, list(dict.fromkeys(by)))
+        if kind == "line":
+            fig = plotly.express.line(sampled, render_mode="webgl" if len(sampled) > WEBGL_THRESHOLD else "svg",
+                                      **kwargs)
+        else:
+            fig = plotly.express.area(sampled, **kwargs)
+        note = f"{n} rows downsampled to {len(sampled)} points"
+    elif kind == "scatter" and n > WEBGL_THRESHOLD:
+        fig = plotly.express.scatter(table, render_mode="webgl", **kwargs)
+
+    if fig is None:
+        if kind == "pie":
+            fig = plotly.express.pie(table, **kwargs)
+        else:
+            fig = plotly.plot(table, kind, **kwargs)
+    if note is not None:
+        _mark_aggregated(fig, note)
+    return fig, note
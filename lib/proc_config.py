@@ -9,7 +9,7 @@ KEYWORDS = {
         "пожаротушение"
     },
     "traffic": {
-        "дорожный - транспортный происшествие"
+        "дорожный - транспортный происшествие",
         "дорожный", "автомобиль"
     },
     "rescue": {
@@ -21,8 +21,8 @@ KEYWORDS = {
         "купание", "купания", "купаться"
     },
     "flood": {
-        "паводок", "наводнение", "половодье", "подтопление"
-                                              "наводнило", "затопило",
+        "паводок", "наводнение", "половодье", "подтопление",
+        "наводнило", "затопило",
         "паводкоопасный"
     }
 }
@@ -1,5 +1,8 @@
 from typing import *
 import os
+import hashlib
+
+import numpy as np
 
 import spacy.cli
 import spacy.tokens
@@ -10,7 +13,7 @@ import utils
 
 from . import proc_config
 
-__all__ = ["NLP", "MCHSTextProcessor"]
+__all__ = ["NLP", "KeywordTypeClassifier", "TYPE_CLASSIFIER", "MCHSTextProcessor", "PROCESSOR_VERSION"]
 
 if os.path.isdir(utils.PATH.SPACY_MODEL):
     NLP = spacy.load(utils.PATH.SPACY_MODEL)
@@ -28,32 +31,135 @@ for key, ps in proc_config.PATTERNS.items():
     _pattern_matcher.add(key, ps)
 
 
+def _resolve_entities(old_entities: Sequence[spacy.tokens.Span],
+                      spans: Iterable[spacy.tokens.Span]) -> List[spacy.tokens.Span]:
+    """
+    Merge pattern matches into existing entities in a single sweep over spans sorted by start.
+    Of overlapping matches the longest one wins, any existing entity overlapped by a match is dropped.
+    """
+    new_entities = []
+    covered = []
+    for span in sorted(spans, key=lambda e: (e.start, -e.end)):
+        # Kept spans are disjoint and sorted, so only the last one can overlap with current
+        if new_entities and (last := new_entities[-1]).end > span.start:
+            if (span.end - span.start) >= (last.end - last.start):
+                new_entities[-1] = span
+        else:
+            new_entities.append(span)
+        # Union of all matched token ranges, including matches that lost to a longer one
+        if covered and covered[-1][1] >= span.start:
+            covered[-1][1] = max(covered[-1][1], span.end)
+        else:
+            covered.append([span.start, span.end])
+
+    entities = []
+    i, n = 0, len(covered)
+    for entity in sorted(old_entities, key=lambda e: e.start):
+        while i < n and covered[i][1] <= entity.start:
+            i += 1
+        if i == n or covered[i][0] >= entity.end:
+            entities.append(entity)
+    return entities + new_entities
+
+
 @spacy.Language.component("pattern_entity_tagger")
 def pattern_tag_entities(doc: spacy.tokens.Doc, matcher: spacy.matcher.Matcher = _pattern_matcher):
-    old_entities = list(doc.ents)
-    new_entities = []
-    for m_id, start, end in matcher(doc):
-        span = spacy.tokens.Span(doc, start, end, label=matcher.vocab.strings[m_id])
-        for entity in old_entities[:]:
-            if entity.start < span.end and entity.end > span.start:
-                old_entities.remove(entity)
-        for entity in new_entities[:]:
-            if entity.start < span.end and entity.end > span.start:
-                span = span if (span.end - span.start) >= (entity.end - entity.start) else entity
-                new_entities.remove(entity)
-        new_entities.append(span)
-    doc.set_ents(old_entities + new_entities)
+    strings = matcher.vocab.strings
+    doc.set_ents(_resolve_entities(
+        doc.ents,
+        (spacy.tokens.Span(doc, start, end, label=strings[m_id]) for m_id, start, end in matcher(doc))))
     return doc
 
 
 NLP.add_pipe("pattern_entity_tagger", last=True)
 
 
+class KeywordTypeClassifier:
+    """
+    Precompiled news type classifier, scoring every type by the number of its keywords met in text lemmas.
+    Single-word keywords are looked up in a lemma hash map, multi-word ones are matched as lemma phrases
+    indexed by their first lemma, so lemmas of a document are walked only once.
+    """
+
+    def __init__(self, keywords: Mapping[str, Iterable[str]] = None):
+        if keywords is None:
+            keywords = proc_config.KEYWORDS
+        self.types: List[str] = list(keywords.keys())
+        self._words: Dict[str, List[int]] = {}
+        self._phrases: Dict[str, List[Tuple[Tuple[str, ...], int]]] = {}
+        for n, kws in enumerate(keywords.values()):
+            for kw in kws:
+                if len(lemmas := tuple(kw.lower().split())) == 1:
+                    self._words.setdefault(lemmas[0], []).append(n)
+                elif lemmas:
+                    self._phrases.setdefault(lemmas[0], []).append((lemmas, n))
+
+    @staticmethod
+    def lemmas(doc: spacy.tokens.Doc) -> List[str]:
+        return [t.lemma_.lower() for t in doc]
+
+    def score_lemmas(self, lemmas: Sequence[str]) -> List[int]:
+        """
+        Keyword occurrence count of each type in .types order.
+        """
+        scores = [0] * len(self.types)
+        words, phrases = self._words, self._phrases
+        for i, lemma in enumerate(lemmas):
+            for n in words.get(lemma, ()):
+                scores[n] += 1
+            for phrase, n in phrases.get(lemma, ()):
+                if tuple(lemmas[i:i + len(phrase)]) == phrase:
+                    scores[n] += 1
+        return scores
+
+    def scores(self, doc: spacy.tokens.Doc) -> Dict[str, int]:
+        return dict(zip(self.types, self.score_lemmas(self.lemmas(doc))))
+
+    def classify(self, doc: spacy.tokens.Doc) -> Optional[str]:
+        """
+        Type with the highest score, first one in .types order on ties, None if no keywords found.
+        """
+        scores = self.score_lemmas(self.lemmas(doc))
+        return self.types[scores.index(best)] if (best := max(scores, default=0)) > 0 else None
+
+    def scores_batch(self, lemma_lists: Iterable[Sequence[str]]) -> np.ndarray:
+        """
+        Score matrix of shape (documents, types) for a batch of lemma lists.
+        """
+        return np.array([self.score_lemmas(lemmas) for lemmas in lemma_lists],
+                        dtype=np.int32).reshape(-1, len(self.types))
+
+    def classify_batch(self, lemma_lists: Iterable[Sequence[str]]) -> List[Optional[str]]:
+        scores = self.scores_batch(lemma_lists)
+        if not scores.size:
+            return [None] * len(scores)
+        best = scores.argmax(axis=1)
+        types = np.array(self.types + [None], dtype=object)
+        return types[np.where(scores[np.arange(len(scores)), best] > 0, best, len(self.types))].tolist()
+
+
+TYPE_CLASSIFIER = KeywordTypeClassifier()
+
+
 class MCHSTextProcessor:
+    # Should be increased on every change of processing code, see PROCESSOR_VERSION
+    revision = 1
 
-    def __init__(self, text: str, nlp: spacy.Language = NLP):
+    def __init__(self, text: Union[str, spacy.tokens.Doc], nlp: spacy.Language = NLP):
+        """
+        :param text: raw text to be processed by nlp or already processed document.
+        """
         self._nlp = nlp
-        self.doc = self._nlp(text)
+        self.doc = text if isinstance(text, spacy.tokens.Doc) else self._nlp(text)
+
+    @classmethod
+    def pipe(cls, texts: Iterable[str], nlp: spacy.Language = NLP, *,
+             batch_size: int = 64, n_process: int = 1) -> Iterator["MCHSTextProcessor"]:
+        """
+        Batched (and optionally multiprocess) processing of texts stream.
+        """
+        for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+            yield cls(doc, nlp)
 
     def process(self):
         doc = self.doc
@@ -63,18 +169,8 @@ class MCHSTextProcessor:
         return news
 
     @staticmethod
-    def _extract_type(doc: spacy.tokens.Doc):
-        lemma: str = doc[:].lemma_
-        news_type = None
-        type_score = 0
-        for i, kws in proc_config.KEYWORDS.items():
-            score = 0
-            for kw in kws:
-                score += lemma.count(kw)
-            if score > type_score:
-                news_type = i
-                type_score = score
-        return news_type
+    def _extract_type(doc: spacy.tokens.Doc, classifier: KeywordTypeClassifier = TYPE_CLASSIFIER):
+        return classifier.classify(doc)
 
     @staticmethod
     def _process_name(span: spacy.tokens.Span):
@@ -133,3 +229,17 @@ class MCHSTextProcessor:
                     len(entity) == 1 and entity.lemma_ != 'россия':
                 entities['city'] = entity.lemma_
         return entities
+
+
+def _processor_version() -> str:
+    """
+    Short digest of everything that affects processing results.
+    """
+    config = (MCHSTextProcessor.revision,
+              NLP.meta.get("name"), NLP.meta.get("version"),
+              {k: sorted(v) for k, v in proc_config.KEYWORDS.items()},
+              proc_config.PATTERNS)
+    return hashlib.md5(repr(config).encode("utf8")).hexdigest()[:16]
+
+
+PROCESSOR_VERSION = _processor_version()
@@ -0,0 +1,143 @@
+"""
+Offline reprocessing of stored news texts with current text processor.
+"""
+from typing import *
+
+import datetime
+
+from sqlalchemy.engine import Engine, URL, Connection
+from sqlalchemy.orm import Session, with_polymorphic
+from sqlalchemy import or_, bindparam, Table
+
+from .parsing import NEWS_DICT
+from .processing import MCHSTextProcessor, PROCESSOR_VERSION
+from .engines import get_engine
+from .rollups import RollupTracker
+from .date_utils import MCHS_TZ
+from .db import *
+
+__all__ = ["DERIVED_FIELDS", "MCHSReprocessor"]
+
+# News table columns derived from text by MCHSTextProcessor, besides type and type specific columns
+DERIVED_FIELDS = ("region", "city", "injuries", "n_staff", "n_tech")
+
+
+class MCHSReprocessor:
+    """
+    Class that reprocesses texts of stored news, which were processed by other processor version.
+    News are read in id-ordered chunks and every chunk is written in its own transaction,
+    so interrupted reprocessing resumes from the first stale news.
+    """
+
+    def __init__(self,
+                 db_url: URL, *,
+                 chunk_size: int = 500, batch_size: int = 64, n_process: int = 1,
+                 version: str = PROCESSOR_VERSION):
+        """
+        :param chunk_size: news read and written per transaction.
+        :param batch_size: texts per NLP pipe batch.
+        :param n_process: NLP pipe processes.
+        """
+        self.engine: Engine = get_engine(db_url)
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.version = version
+        ProcessedNews.__table__.create(self.engine, checkfirst=True)
+        self.rollups = RollupTracker(self.engine)
+
+    def _stale_query(self, session: Session, after: int = None):
+        news = with_polymorphic(News, "*")
+        query = session.query(news) \
+            .outerjoin(ProcessedNews, ProcessedNews.id == news.id) \
+            .filter(or_(ProcessedNews.version.is_(None), ProcessedNews.version != self.version))
+        if after is not None:
+            query = query.filter(news.id > after)
+        return query.order_by(news.id)
+
+    def count_stale(self) -> int:
+        with Session(self.engine) as session:
+            return self._stale_query(session).count()
+
+    def chunks(self) -> Iterator[List[News]]:
+        """
+        Stream stale news with all type specific columns loaded.
+        Chunks are requested by id keyset instead of a single open cursor,
+        so that writes between chunks do not conflict with reading (e.g. SQLite locks).
+        """
+        last = None
+        while True:
+            with Session(self.engine) as session:
+                chunk = self._stale_query(session, last).limit(self.chunk_size).all()
+            if not chunk:
+                break
+            yield chunk
+            last = chunk[-1].id
+
+    def process(self, chunk: List[News]) -> List[Optional[NEWS_DICT]]:
+        processed = MCHSTextProcessor.pipe((news.text for news in chunk if news.text),
+                                           batch_size=self.batch_size, n_process=self.n_process)
+        return [next(processed).process() if news.text else None for news in chunk]
+
+    def run(self, progress: Callable[[int], Any] = None) -> int:
+        """
+        Reprocess all stale news.
+        :param progress: called with number of reprocessed news after every chunk.
+        :return: number of reprocessed news.
+        """
+        done = 0
+        for chunk in self.chunks():
+            results = self.process(chunk)
+            with self.engine.begin() as con:
+                self._write_chunk(con, chunk, results)
+            done += len(chunk)
+            if progress is not None:
+                progress(done)
+        return done
+
+    def _write_chunk(self, con: Connection, chunk: List[News], results: List[Optional[NEWS_DICT]]):
+        """
+        Bulk update changed fields and move news between type tables when type is changed.
+        """
+        ids = [news.id for news in chunk]
+        rollups = self.rollups.before(con, ids)
+        base = News.__table__
+        polymorphic_map = News.__mapper__.polymorphic_map
+        updates = []
+        type_updates: Dict[Table, List[Dict[str, Any]]] = {}
+        type_deletes: Dict[Table, List[int]] = {}
+        type_inserts: Dict[Table, List[Dict[str, Any]]] = {}
+        for news, data in zip(chunk, results):
+            if data is None:
+                continue
+            type_name = t if (t := data.get("type", None)) is not None else News.__mapper__.polymorphic_identity
+            cls = polymorphic_map[type_name].class_
+            values = {k: data.get(k, None) for k in DERIVED_FIELDS}
+            values["type_name"] = type_name
+            if any(getattr(news, k) != v for k, v in values.items()):
+                updates.append({"_id": news.id, **values})
+
+            type_values = {k: data.get(k, None) for k in type_columns(cls)}
+            if cls is type(news):
+                if any(getattr(news, k) != v for k, v in type_values.items()):
+                    type_updates.setdefault(cls.__table__, []).append({"_id": news.id, **type_values})
+            else:
+                if (old := type(news).__table__) is not base:
+                    type_deletes.setdefault(old, []).append(news.id)
+                if (new := cls.__table__) is not base:
+                    type_inserts.setdefault(new, []).append({"id": news.id, **type_values})
+
+        for table, ids in type_deletes.items():
+            con.execute(table.delete().where(table.c.id.in_(ids)))
+        if updates:
+            con.execute(base.update().where(base.c.id == bindparam("_id")), updates)
+        for table, rows in type_inserts.items():
+            con.execute(table.insert(), rows)
+        for table, rows in type_updates.items():
+            con.execute(table.update().where(table.c.id == bindparam("_id")), rows)
+
+        processed = ProcessedNews.__table__
+        now = datetime.datetime.now(tz=MCHS_TZ)
+        con.execute(processed.delete().where(processed.c.id.in_(ids)))
+        con.execute(processed.insert(), [{"id": i, "version": self.version, "processed": now} for i in ids])
+        self.rollups.after(con, ids, rollups)
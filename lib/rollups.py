@@ -0,0 +1,167 @@
+"""
+Rollup table of news counts and sums per period, maintained incrementally on writes.
+"""
+from typing import *
+
+import datetime
+
+from sqlalchemy.engine import Engine, URL, Connection
+from sqlalchemy import inspect, select, and_, bindparam
+
+import pandas as pd
+
+from .analysis import news_select, compact
+from .upserts import upsert
+from .engines import get_engine
+from .db import *
+
+__all__ = ["ROLLUP_GRAINS", "ROLLUP_MEASURES", "UNKNOWN_REGION",
+           "period_start", "has_rollups", "contributions", "difference", "apply_delta", "RollupTracker",
+           "rebuild", "read_rollups"]
+
+ROLLUP_GRAINS = ("day", "week", "month")
+# Summed news columns
+ROLLUP_MEASURES = ("injuries", "n_staff", "n_tech", "area")
+UNKNOWN_REGION = ""
+
+ROLLUP_KEY = Tuple[str, datetime.date, str, str]
+# News count followed by ROLLUP_MEASURES sums
+ROLLUP_VALUES = List[int]
+
+
+def period_start(date: datetime.datetime, grain: str) -> datetime.date:
+    date = date.date()
+    if grain == "day":
+        return date
+    elif grain == "week":
+        return date - datetime.timedelta(days=date.weekday())
+    elif grain == "month":
+        return date.replace(day=1)
+    raise ValueError(f"Invalid rollup grain {grain}.")
+
+
+def has_rollups(con: Union[Engine, Connection]) -> bool:
+    return inspect(con).has_table(NewsRollup.__tablename__)
+
+
+def contributions(con: Connection, ids: Iterable[int] = None) -> Dict[ROLLUP_KEY, ROLLUP_VALUES]:
+    """
+    Rollup values of news with ids (all news by default) as they are currently stored.
+    News without date are not rolled up.
+    """
+    query = news_select(["id", "date", "type", "region", *ROLLUP_MEASURES])
+    if ids is not None:
+        query = query.where(News.__table__.c.id.in_(list(ids)))
+    totals = {}
+    for row in con.execute(query):
+        if row.date is None:
+            continue
+        measures = [getattr(row, m) or 0 for m in ROLLUP_MEASURES]
+        region = row.region if row.region is not None else UNKNOWN_REGION
+        for grain in ROLLUP_GRAINS:
+            values = totals.setdefault((grain, period_start(row.date, grain), row.type, region),
+                                       [0] * (len(ROLLUP_MEASURES) + 1))
+            values[0] += 1
+            for i, v in enumerate(measures, 1):
+                values[i] += v
+    return totals
+
+
+def difference(after: Dict[ROLLUP_KEY, ROLLUP_VALUES],
+               before: Dict[ROLLUP_KEY, ROLLUP_VALUES]) -> Dict[ROLLUP_KEY, ROLLUP_VALUES]:
+    """
+    Non-zero changes of rollup values, e.g. moves of rewritten news to other type, region or period.
+    """
+    zero = [0] * (len(ROLLUP_MEASURES) + 1)
+    delta = {}
+    for key in after.keys() | before.keys():
+        values = [a - b for a, b in zip(after.get(key, zero), before.get(key, zero))]
+        if any(values):
+            delta[key] = values
+    return delta
+
+
+def _key_row(key: ROLLUP_KEY) -> Dict[str, Any]:
+    grain, period, type_name, region = key
+    return {"grain": grain, "period": period, "type_name": type_name, "region": region}
+
+
+def apply_delta(con: Connection, delta: Dict[ROLLUP_KEY, ROLLUP_VALUES]):
+    """
+    Add changes to rollup rows, creating missing ones and deleting ones left without news.
+    """
+    if not delta:
+        return
+    table = NewsRollup.__table__
+    zeros = dict.fromkeys(("news", *ROLLUP_MEASURES), 0)
+    upsert(con, table, [{**_key_row(key), **zeros} for key in delta.keys()], update=())
+    columns = ("news", *ROLLUP_MEASURES)
+    key_condition = and_(*(table.c[k] == bindparam(f"_{k}") for k in ("grain", "period", "type_name", "region")))
+    con.execute(
+        table.update()
+        .where(key_condition)
+        .values({k: table.c[k] + bindparam(f"_d_{k}") for k in columns}),
+        [{**{f"_{k}": v for k, v in _key_row(key).items()},
+          **{f"_d_{k}": v for k, v in zip(columns, values)}}
+         for key, values in delta.items()])
+    # Only changed rows may be left without news, they are looked up by primary key
+    if emptied := [key for key, values in delta.items() if values[0] < 0]:
+        con.execute(table.delete().where(key_condition, table.c.news <= 0),
+                    [{f"_{k}": v for k, v in _key_row(key).items()} for key in emptied])
+
+
+class RollupTracker:
+    """
+    Keeps rollups of engine schema up to date with writes of news,
+    if rollup table is present (created by migration, which also fills it).
+    """
+
+    def __init__(self, engine: Engine):
+        self.enabled = has_rollups(engine)
+
+    def before(self, con: Connection, ids: Iterable[int]) -> Optional[Dict[ROLLUP_KEY, ROLLUP_VALUES]]:
+        """
+        Rollup values of news before they are written in the same transaction.
+        """
+        return contributions(con, ids) if self.enabled else None
+
+    def after(self, con: Connection, ids: Iterable[int], before: Optional[Dict[ROLLUP_KEY, ROLLUP_VALUES]]):
+        """
+        Update rollups by the change of news values since before().
+        """
+        if self.enabled and before is not None:
+            apply_delta(con, difference(contributions(con, ids), before))
+
+
+def rebuild(con: Union[Engine, Connection], batch_size: int = 1000) -> int:
+    """
+    Recompute rollup table from all news, in a single transaction if engine is given.
+    :return: number of rollup rows.
+    """
+    if isinstance(con, Engine):
+        with con.begin() as transaction_con:
+            return rebuild(transaction_con, batch_size)
+    table = NewsRollup.__table__
+    table.create(con, checkfirst=True)
+    totals = contributions(con.execution_options(stream_results=True))
+    con.execute(table.delete())
+    rows = [{**_key_row(key), **dict(zip(("news", *ROLLUP_MEASURES), values))}
+            for key, values in totals.items()]
+    for i in range(0, len(rows), batch_size):
+        con.execute(table.insert(), rows[i:i + batch_size])
+    return len(rows)
+
+
+def read_rollups(url: URL, grain: str = "day") -> pd.DataFrame:
+    """
+    Rollup rows of grain, with period as datetime and type_name renamed to type like in news frames.
+    """
+    table = NewsRollup.__table__
+    query = select(*(col.label("type") if col.name == "type_name" else col
+                     for col in table.columns if col.name != "grain")) \
+        .where(table.c.grain == grain) \
+        .order_by(table.c.period, table.c.type_name, table.c.region)
+    with get_engine(url).connect() as con:
+        rollups = pd.read_sql(query, con)
+    rollups['period'] = pd.to_datetime(rollups['period'])
+    return compact(rollups, {name: col.type for name, col in query.selected_columns.items()})
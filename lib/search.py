@@ -0,0 +1,180 @@
+"""
+Full-text search of news title and text: MySQL FULLTEXT index, SQLite FTS5 table, LIKE elsewhere.
+"""
+from typing import *
+
+import re
+import datetime
+
+from sqlalchemy.event import listens_for
+from sqlalchemy.engine import Engine, URL, Connection
+from sqlalchemy.sql.expression import FunctionElement, ColumnElement
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy import MetaData, Table, Integer, Float, Text, inspect, select, text, column, literal, or_, bindparam
+
+import pandas as pd
+
+from .engines import get_engine
+from .db import *
+
+__all__ = ["FULLTEXT_INDEX", "FTS_TABLE",
+           "has_search_index", "create_search_index", "SearchIndex", "search"]
+
+FULLTEXT_INDEX = "ix_news_fulltext"
+FTS_TABLE = "__news_fts"
+
+
+def _dialect(con: Union[Engine, Connection]) -> str:
+    return "mysql" if (name := con.dialect.name) == "mariadb" else name
+
+
+def has_search_index(con: Union[Engine, Connection]) -> bool:
+    dialect = _dialect(con)
+    if dialect == "mysql":
+        return any(index["name"] == FULLTEXT_INDEX for index in inspect(con).get_indexes(News.__tablename__))
+    elif dialect == "sqlite":
+        return inspect(con).has_table(FTS_TABLE)
+    return False
+
+
+def create_search_index(con: Connection) -> bool:
+    """
+    Create and fill full-text index of news, if dialect supports it and index is not present yet.
+    :return: whether dialect supports full-text index.
+    """
+    dialect = _dialect(con)
+    if dialect not in {"mysql", "sqlite"}:
+        return False
+    if has_search_index(con):
+        return True
+    if dialect == "mysql":
+        con.execute(text(f"ALTER TABLE {News.__tablename__} ADD FULLTEXT INDEX {FULLTEXT_INDEX} (title, text)"))
+    else:
+        con.execute(text(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, text)"))
+        con.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, title, text) "
+                         f"SELECT id, title, text FROM {News.__tablename__}"))
+    return True
+
+
+@listens_for(Base.metadata, "after_create")
+def _create_search_index(metadata: MetaData, con: Connection, tables: List[Table] = (), **kwargs):
+    if News.__table__ in tables:
+        create_search_index(con)
+
+
+class SearchIndex:
+    """
+    Keeps full-text index of engine schema up to date with writes of news.
+    MySQL maintains FULLTEXT index itself, FTS5 table of SQLite is rewritten for written news.
+    """
+
+    def __init__(self, engine: Engine):
+        self.enabled = _dialect(engine) == "sqlite" and has_search_index(engine)
+
+    def update(self, con: Connection, ids: Iterable[int]):
+        if not self.enabled:
+            return
+        ids = list(ids)
+        fts = text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True))
+        con.execute(fts, {"ids": ids})
+        fts = text(f"INSERT INTO {FTS_TABLE} (rowid, title, text) "
+                   f"SELECT id, title, text FROM {News.__tablename__} WHERE id IN :ids") \
+            .bindparams(bindparam("ids", expanding=True))
+        con.execute(fts, {"ids": ids})
+
+
+def _terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query)
+
+
+def _fts5_query(query: str) -> str:
+    # Quoted terms, so that FTS5 syntax in user input is matched literally
+    return " ".join(f'"{term}"' for term in _terms(query))
+
+
+def _snippet(content: Optional[str], terms: List[str], width: int = 60) -> str:
+    """
+    Part of content around the first found term, which is marked with brackets.
+    """
+    if not content:
+        return ""
+    if terms and (m := re.search("|".join(re.escape(t) for t in terms), content, re.IGNORECASE)):
+        start, end = max(m.start() - width, 0), min(m.end() + width, len(content))
+        return f"{'…' if start else ''}{content[start:m.start()]}[{m.group()}]{content[m.end():end]}" \
+               f"{'…' if end < len(content) else ''}"
+    return content[:2 * width] + ("…" if len(content) > 2 * width else "")
+
+
+class fulltext_match(FunctionElement):
+    """
+    Relevance of title and text to query by MySQL FULLTEXT index in natural language mode.
+    """
+    name = "fulltext_match"
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(fulltext_match, "mysql")
+@compiles(fulltext_match, "mariadb")
+def _compile_fulltext_match_mysql(element, compiler, **kw):
+    title, content, query = element.clauses
+    return f"MATCH ({compiler.process(title, **kw)}, {compiler.process(content, **kw)}) " \
+           f"AGAINST ({compiler.process(query, **kw)} IN NATURAL LANGUAGE MODE)"
+
+
+def search(url: URL, query: str, *, limit: Optional[int] = 100,
+           date_from: datetime.datetime = None, date_to: datetime.datetime = None,
+           types: Iterable[str] = None) -> pd.DataFrame:
+    """
+    News matching query, most relevant first.
+    Without full-text index news containing all query words in title or text are found, newest first.
+    :param limit: maximum number of found news, None for no limit.
+    :param date_from: only news at or after date.
+    :param date_to: only news before date.
+    :param types: only news of types.
+    :return: frame with id, date, type, title, score and snippet columns.
+    """
+    news = News.__table__
+    terms = _terms(query)
+    if not terms:
+        return pd.DataFrame(columns=["id", "date", "type", "title", "score", "snippet"])
+    conditions: List[ColumnElement] = []
+    if date_from is not None:
+        conditions.append(news.c.date >= date_from)
+    if date_to is not None:
+        conditions.append(news.c.date < date_to)
+    if types is not None:
+        conditions.append(news.c.type_name.in_(list(types)))
+    columns = [news.c.id, news.c.date, news.c.type_name.label("type"), news.c.title]
+
+    engine = get_engine(url)
+    dialect = _dialect(engine)
+    with engine.connect() as con:
+        indexed = has_search_index(con)
+        if indexed and dialect == "sqlite":
+            fts = text(f"SELECT rowid AS id, -bm25({FTS_TABLE}) AS score, "
+                       f"snippet({FTS_TABLE}, 1, '[', ']', '…', 16) AS snippet "
+                       f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query") \
+                .bindparams(query=_fts5_query(query)) \
+                .columns(column("id", Integer), column("score", Float), column("snippet", Text)) \
+                .subquery("fts")
+            stmt = select(*columns, fts.c.score, fts.c.snippet) \
+                .join(fts, fts.c.id == news.c.id) \
+                .where(*conditions) \
+                .order_by(fts.c.score.desc(), news.c.id.desc()) \
+                .limit(limit)
+            return pd.read_sql(stmt, con)
+
+        if indexed:
+            score = fulltext_match(news.c.title, news.c.text, query)
+            stmt = select(*columns, score.label("score"), news.c.text) \
+                .where(score > 0, *conditions) \
+                .order_by(score.desc(), news.c.id.desc())
+        else:
+            stmt = select(*columns, literal(0.0).label("score"), news.c.text) \
+                .where(*(or_(news.c.title.ilike(f"%{t}%"), news.c.text.ilike(f"%{t}%")) for t in terms),
+                       *conditions) \
+                .order_by(news.c.date.desc(), news.c.id.desc())
+        found = pd.read_sql(stmt.limit(limit), con)
+    found['snippet'] = [_snippet(t, terms) for t in found.pop('text')]
+    return found
@@ -0,0 +1,147 @@
+"""
+News tags as sparse news x tag indicator matrix and long (exploded) table.
+"""
+from typing import *
+
+from sqlalchemy.engine import URL
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy import select
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from . import db
+from .engines import get_engine
+
+__all__ = ["read_tags", "explode_tags", "TagMatrix"]
+
+
+def read_tags(url: URL, where: ColumnElement = None) -> pd.DataFrame:
+    """
+    Long table of news tags with news_id, categorical tag and priority columns.
+    :param where: condition on news table columns.
+    """
+    news = db.News.__table__
+    query = select(db.NewsTags.news_id, db.Tag.name.label("tag"), db.NewsTags.priority) \
+        .join(db.Tag, db.Tag.id == db.NewsTags.tag_id) \
+        .order_by(db.NewsTags.news_id, db.NewsTags.priority)
+    if where is not None:
+        query = query.join(news, news.c.id == db.NewsTags.news_id).where(where)
+    with get_engine(url).connect() as con:
+        tags = pd.read_sql(query, con)
+    tags['tag'] = tags['tag'].astype("category")
+    return tags
+
+
+def explode_tags(news: pd.DataFrame) -> pd.DataFrame:
+    """
+    Long table of news frame tags with news_id, categorical tag and priority columns.
+    """
+    # Tags of frames read from Arrow (e.g. FrameCache) may be ndarrays, missing tags are None
+    tags = [t if isinstance(t, (list, tuple, np.ndarray)) else () for t in news['tags']]
+    lengths = np.fromiter(map(len, tags), dtype=np.int64, count=len(tags))
+    ids = np.repeat(news['id'].to_numpy(dtype=np.int64), lengths)
+    flat = [tag for t in tags for tag in t]
+    # Priority is the position of tag in news tags, which are ordered by it
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return pd.DataFrame({
+        "news_id": ids,
+        "tag": pd.Categorical(flat),
+        "priority": np.arange(len(flat)) - starts,
+    })
+
+
+class TagMatrix:
+    """
+    Sparse (CSR) indicator matrix of news (rows, by id) and tags (columns, by name).
+    """
+
+    def __init__(self, news_ids: Sequence[int], tags: Sequence[str], matrix: scipy.sparse.csr_matrix):
+        self.news_ids = pd.Index(news_ids, name="news_id")
+        self.tags = pd.Index(tags, name="tag")
+        if matrix.shape != (len(self.news_ids), len(self.tags)):
+            raise ValueError(f"Matrix shape {matrix.shape} doesn't match {len(self.news_ids)} news "
+                             f"and {len(self.tags)} tags.")
+        self.matrix = matrix.tocsr()
+
+    @classmethod
+    def from_long(cls, long: pd.DataFrame, news_ids: Sequence[int] = None) -> "TagMatrix":
+        """
+        :param long: table with news_id and tag columns, see read_tags and explode_tags.
+        :param news_ids: rows of matrix, ids of long table by default. Tags of other news are ignored.
+        """
+        if news_ids is None:
+            news_ids = long['news_id'].unique()
+        news_ids = pd.Index(news_ids)
+        tags = long['tag'].astype("category")
+        rows = news_ids.get_indexer(long['news_id'])
+        known = rows != -1
+        matrix = scipy.sparse.csr_matrix(
+            (np.ones(known.sum(), dtype=np.bool_), (rows[known], tags.cat.codes.to_numpy()[known])),
+            shape=(len(news_ids), len(tags.cat.categories)))
+        return cls(news_ids, tags.cat.categories, matrix)
+
+    @classmethod
+    def from_frame(cls, news: pd.DataFrame) -> "TagMatrix":
+        """
+        Matrix of news frame with id and tags columns, rows follow news frame order.
+        """
+        return cls.from_long(explode_tags(news), news['id'].to_numpy(dtype=np.int64))
+
+    def long(self) -> pd.DataFrame:
+        """
+        Long table with news_id and categorical tag columns.
+        """
+        coo = self.matrix.tocoo()
+        return pd.DataFrame({
+            "news_id": self.news_ids[coo.row],
+            "tag": pd.Categorical.from_codes(coo.col, self.tags),
+        })
+
+    def frequency(self) -> pd.Series:
+        """
+        Number of news with every tag, most frequent first.
+        """
+        counts = np.asarray(self.matrix.sum(axis=0, dtype=np.int64)).ravel()
+        return pd.Series(counts, index=self.tags, name="count").sort_values(ascending=False)
+
+    def cooccurrence(self, top: int = None) -> pd.DataFrame:
+        """
+        Number of news with both tags, diagonal is tag frequency.
+        :param top: only top most frequent tags.
+        """
+        matrix, tags = self.matrix, self.tags
+        if top is not None:
+            counts = np.asarray(matrix.sum(axis=0, dtype=np.int64)).ravel()
+            columns = np.sort(np.argsort(-counts, kind="stable")[:top])
+            matrix, tags = matrix[:, columns], tags[columns]
+        matrix = matrix.astype(np.int64)
+        return pd.DataFrame((matrix.T @ matrix).toarray(), index=tags, columns=tags)
+
+    def mask(self, tags: Iterable[str], how: str = "any") -> np.ndarray:
+        """
+        Boolean mask of news (rows) with any or all of tags. Unknown tags match no news.
+        :param how: "any" or "all".
+        """
+        tags = list(tags)
+        columns = self.tags.get_indexer(tags)
+        if how == "any":
+            columns = columns[columns != -1]
+            need = 1
+        elif how == "all":
+            if (columns == -1).any():
+                return np.zeros(len(self.news_ids), dtype=np.bool_)
+            need = len(set(columns))
+            columns = np.unique(columns)
+        else:
+            raise ValueError(f"Invalid mask mode {how}.")
+        counts = np.asarray(self.matrix[:, columns].sum(axis=1, dtype=np.int64)).ravel()
+        return counts >= need if need else np.ones(len(self.news_ids), dtype=np.bool_)
+
+    def subset(self, news: pd.DataFrame, tags: Iterable[str], how: str = "any") -> pd.DataFrame:
+        """
+        Rows of news frame with any or all of tags.
+        """
+        ids = self.news_ids[self.mask(tags, how)]
+        return news[news['id'].isin(ids)]
@@ -9,11 +9,14 @@ import aiohttp
 import sqlalchemy.orm
 from sqlalchemy.engine import Engine, URL
 from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy import create_engine
+from sqlalchemy import select, insert, literal
 
 from .fetching import MCHSFetcher
 from .parsing import NEWS_DICT, MCHSPageParser, MCHSNewsParser
 from .processing import MCHSTextProcessor
+from .writing import NewsWriter
+from .db_worker import DBWorker
+from .engines import get_engine
 from .db import *
 
 __all__ = ["NEWS_TEST_F", "NEWS_LIST_TEST_F", "MCHSUpdater"]
@@ -34,8 +37,12 @@ class MCHSUpdater(MCHSFetcher):
                  max_page_requests: int = None, max_news_requests: int = None,
                  max_requests: int = None):
         super().__init__(loop, session, max_page_requests, max_news_requests, max_requests)
-        self.engine: Engine = create_engine(db_url)
+        self.engine: Engine = get_engine(db_url)
         self.Session = scoped_session(sessionmaker(self.engine))
+        # Service table may be missing in schemas created before processor versioning
+        ProcessedNews.__table__.create(self.engine, checkfirst=True)
+        self.db_worker = DBWorker(self.loop)
+        self.writer = NewsWriter(self.engine, self.db_worker)
 
     class PageUpdateTask(MCHSFetcher.PageRequestTask):
         manager: "MCHSUpdater"
@@ -66,17 +73,11 @@ class MCHSUpdater(MCHSFetcher):
             return news
 
         async def _update_news(self, news: List[NEWS_DICT]):
+            ids = [i['id'] for i in news]
+            known, pending = await self.manager.db_worker.run(self.manager.check_news, ids)
             for i in news:
                 news_id: int = i['id']
-                # Check news update needed
-                with self.manager.Session() as session:
-                    session: sqlalchemy.orm.Session
-                    existing = session.query(ExistingNews).filter_by(id=news_id).one_or_none() is not None
-                    if not existing and session.query(News).filter_by(id=news_id).one_or_none() is None:
-                        session.add(ExistingNews(id=news_id))
-                        existing = True
-                        session.commit()
-                if existing or self.overwrite:
+                if news_id not in known or self.overwrite:
                     # Update news task
                     self.manager.update_news(news_id, url=i.get("link", None), retry=self.retry)
 
@@ -139,36 +140,36 @@ class MCHSUpdater(MCHSFetcher):
 
         async def _write_news(self):
             """
-            Write data dict as news to database.
+            Write data dict as news to database with manager's batched writer.
             """
-            data = self.news
-            with self.manager.Session() as session, session.begin():
-                session: sqlalchemy.orm.Session
-                NewsTyped = News
-                if (type_name := data.get("type", None)) is not None:
-                    news_type = session.merge(Type(name=type_name))
-                    NewsTyped = News.__mapper__.polymorphic_map[news_type.name].class_
-                cols = {k: v for k, v in data.items() if k in {
-                    "id", "title", "date", "text", "image", "region", "city", "injuries", "n_staff", "n_tech"
-                }}
-                for type_col in set(NewsTyped.__mapper__.columns) - set(News.__mapper__.columns):
-                    if (col_name := type_col.name) != "id" and (v := data.get(col_name, None)) is not None:
-                        cols[col_name] = v
-                news: News = session.merge(NewsTyped(**cols))
-                if "categories" in data.keys():
-                    news.categories_assoc.clear()
-                if "tags" in data.keys():
-                    news.tags_assoc.clear()
-                session.flush((news,))
-
-                # Filling categories and tags
-                categories = [session.merge(Category(**category)) for category in data.get("categories", ())]
-                tags = [session.merge(Tag(**tag)) for tag in data.get("tags", ())]
-                session.add_all(
-                    NewsCategories(news=news, category=category, priority=n) for n, category in enumerate(categories))
-                session.add_all(
-                    NewsTags(news=news, tag=tag, priority=n) for n, tag in enumerate(tags))
-                session.query(ExistingNews).filter_by(id=news.id).delete()
+            await self.manager.writer.write(self.news)
+
+    def check_news(self, ids: Collection[int]) -> Tuple[Set[int], Set[int]]:
+        """
+        Blocking, should be executed in .db_worker.
+        Classify news ids with a single query into known (already written) and pending (met, but not written yet).
+        All other ids are new and are registered as pending with a single bulk insert.
+        :return: known and pending ids sets, pending including new ones.
+        """
+        if not ids:
+            return set(), set()
+        with self.Session() as session, session.begin():
+            session: sqlalchemy.orm.Session
+            rows = session.execute(
+                select(ExistingNews.id, literal(True)).where(ExistingNews.id.in_(ids)).union_all(
+                    select(News.id, literal(False)).where(News.id.in_(ids)))
+            ).all()
+            pending = {i for i, p in rows if p}
+            known = {i for i, p in rows if not p} - pending
+            if new := set(ids) - known - pending:
+                session.execute(insert(ExistingNews), [{"id": i} for i in new])
+                pending |= new
+        return known, pending
+
+    async def finish_all(self):
+        await super().finish_all()
+        await self.writer.close()
+        self.db_worker.shutdown(wait=False)
 
     def update_page(self, page: int, **kwargs):
         self.register_task(self.PageUpdateTask(self, page, **kwargs))
@@ -0,0 +1,56 @@
+"""
+Dialect-native upsert statements.
+"""
+from typing import *
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from sqlalchemy import Table, and_
+
+__all__ = ["group_rows", "upsert"]
+
+ROW = Dict[str, Any]
+
+
+def group_rows(rows: Iterable[ROW]) -> List[List[ROW]]:
+    """
+    Split rows into groups with the same keys, as executemany requires the same keys in all parameter sets.
+    """
+    groups: Dict[FrozenSet[str], List[ROW]] = {}
+    for row in rows:
+        groups.setdefault(frozenset(row.keys()), []).append(row)
+    return list(groups.values())
+
+
+def upsert(con: Connection, table: Table, rows: Iterable[ROW], update: Iterable[str] = None):
+    """
+    Insert rows or update already existing ones (by primary key) with a single statement for every keys group:
+    INSERT ... ON DUPLICATE KEY UPDATE for MySQL, INSERT ... ON CONFLICT DO UPDATE for SQLite and PostgreSQL.
+    Other dialects fall back to UPDATE and INSERT of rows, which were not updated.
+    Columns missing in row are left untouched for existing rows.
+    :param update: columns updated on conflict, all provided columns besides primary key by default.
+    """
+    pk = [col.name for col in table.primary_key.columns]
+    for group in group_rows(rows):
+        keys = group[0].keys()
+        columns = [k for k in keys if k not in pk] if update is None else [k for k in update if k in keys]
+        dialect = con.dialect.name
+        if dialect in {"mysql", "mariadb"}:
+            stmt = mysql.insert(table)
+            # No-op update of primary key for rows without updated columns
+            stmt = stmt.on_duplicate_key_update({k: stmt.inserted[k] for k in (columns if columns else pk[:1])})
+            con.execute(stmt, group)
+        elif dialect in {"sqlite", "postgresql"}:
+            stmt = (sqlite if dialect == "sqlite" else postgresql).insert(table)
+            if columns:
+                stmt = stmt.on_conflict_do_update(index_elements=pk, set_={k: stmt.excluded[k] for k in columns})
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=pk)
+            con.execute(stmt, group)
+        else:
+            for row in group:
+                where = and_(*(table.c[k] == row[k] for k in pk))
+                if not columns or not con.execute(
+                        table.update().where(where).values({k: row[k] for k in columns})).rowcount:
+                    if not con.execute(table.select().where(where)).first():
+                        con.execute(table.insert(), row)
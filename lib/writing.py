@@ -0,0 +1,208 @@
+"""
+Batched writing of processed news to database.
+"""
+from typing import *
+
+import asyncio
+import datetime
+
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy import Table
+
+from .parsing import NEWS_DICT
+from .processing import PROCESSOR_VERSION
+from .dimensions import DimensionCache
+from .rollups import RollupTracker
+from .search import SearchIndex
+from .upserts import upsert
+from .db_worker import DBWorker
+from .date_utils import MCHS_TZ
+from .db import *
+
+__all__ = ["NEWS_COLUMNS", "NewsWriter"]
+
+# News dict keys written to general news table
+NEWS_COLUMNS = ("id", "title", "date", "text", "image", "region", "city", "injuries", "n_staff", "n_tech")
+
+
+class NewsWriter:
+    """
+    Write stage, gathering processed news dicts and flushing them in batches, each in a single transaction.
+    Batch is flushed when batch_size news are gathered or flush_interval seconds passed since the first of them.
+    Batches are written in database worker thread, writing coroutines wait for a free worker slot,
+    so fetching is slowed down when database falls behind.
+    If batch fails, its news are retried one by one, so that a single broken news fails only its own write.
+    Rollups and full-text index are updated in the same transactions.
+    """
+
+    def __init__(self, engine: Engine, worker: DBWorker, *,
+                 batch_size: int = 50, flush_interval: float = 1.0):
+        self.engine = engine
+        self.worker = worker
+        self.loop = worker.loop
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dimensions = DimensionCache.get(engine)
+        self.rollups = RollupTracker(engine)
+        self.search = SearchIndex(engine)
+        self._pending: List[Tuple[NEWS_DICT, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Flushes started by timer, kept until done
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def write(self, news: NEWS_DICT):
+        """
+        Queue news for writing and wait until its batch is written.
+        """
+        future = self.loop.create_future()
+        self._pending.append((news, future))
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(self.flush_interval, self._flush_later)
+        await future
+
+    def _flush_later(self):
+        self._timer = None
+        task = self.loop.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            errors = await self.worker.run(self.write_items, [news for news, future in batch])
+        except asyncio.CancelledError:
+            for news, future in batch:
+                future.cancel()
+            raise
+        except Exception as exc:
+            errors = [exc] * len(batch)
+        for (news, future), error in zip(batch, errors):
+            if not future.done():
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+
+    async def close(self):
+        """
+        Write pending news and wait until flushes started by timer are finished.
+        """
+        await self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def write_items(self, items: List[NEWS_DICT]) -> List[Optional[BaseException]]:
+        """
+        Blocking write of news batch, falling back to item-level writes if batch fails.
+        :return: write error of each news.
+        """
+        try:
+            with self.engine.begin() as con:
+                self.write_batch(con, items)
+        except Exception:
+            # Dimension rows cached inside rolled back transaction are not present in database
+            self.dimensions.refresh()
+        else:
+            return [None] * len(items)
+        errors = []
+        for news in items:
+            try:
+                with self.engine.begin() as con:
+                    self.write_batch(con, [news])
+            except Exception as exc:
+                self.dimensions.refresh()
+                errors.append(exc)
+            else:
+                errors.append(None)
+        return errors
+
+    def write_batch(self, con: Connection, batch: List[NEWS_DICT]):
+        """
+        Write news dicts with bulk upserts.
+        Like ORM merge, only provided fields of already existing news are overwritten,
+        categories and tags are replaced only if provided.
+        """
+        news_table = News.__table__
+        polymorphic_map = News.__mapper__.polymorphic_map
+        type_tables = {mapper.class_.__table__ for mapper in polymorphic_map.values()} - {news_table}
+        # Last write of the same news wins
+        batch = list({data["id"]: data for data in batch}.values())
+        ids = [data["id"] for data in batch]
+        self.write_dimensions(con, batch)
+        # Overwritten news are subtracted from rollups of their previous type, region and date
+        rollups = self.rollups.before(con, ids)
+
+        news_rows = []
+        news_type_tables: Dict[int, Table] = {}
+        type_rows: Dict[Table, List[Dict[str, Any]]] = {}
+        categories = []
+        tags = []
+        processed = []
+        now = datetime.datetime.now(tz=MCHS_TZ)
+        for data in batch:
+            news_id = data["id"]
+            type_name = t if (t := data.get("type", None)) is not None else News.__mapper__.polymorphic_identity
+            cls = polymorphic_map[type_name].class_
+            news_type_tables[news_id] = table = cls.__table__
+
+            news_rows.append({"type_name": type_name, **{k: v for k, v in data.items() if k in NEWS_COLUMNS}})
+            if table is not news_table:
+                type_rows.setdefault(table, []).append(
+                    {"id": news_id, **{k: v for k in type_columns(cls) if (v := data.get(k, None)) is not None}})
+
+            if "categories" in data.keys():
+                names = list(dict.fromkeys(c["name"] for c in data["categories"] if "name" in c))
+                categories.append((news_id, [{"news_id": news_id, "category_name": name, "priority": n}
+                                             for n, name in enumerate(names)]))
+            if "tags" in data.keys():
+                tag_ids = list(dict.fromkeys(t["id"] for t in data["tags"] if "id" in t))
+                tags.append((news_id, [{"news_id": news_id, "tag_id": tag_id, "priority": n}
+                                       for n, tag_id in enumerate(tag_ids)]))
+            if "text" in data.keys():
+                processed.append({"id": news_id, "version": PROCESSOR_VERSION, "processed": now})
+
+        upsert(con, news_table, news_rows)
+        self.search.update(con, ids)
+        # News might have had other type before
+        for table in type_tables:
+            if other := [news_id for news_id, t in news_type_tables.items() if t is not table]:
+                con.execute(table.delete().where(table.c.id.in_(other)))
+        for table, rows in type_rows.items():
+            upsert(con, table, rows)
+
+        for assoc, rows in ((NewsCategories.__table__, categories), (NewsTags.__table__, tags)):
+            if rows:
+                con.execute(assoc.delete().where(assoc.c.news_id.in_([news_id for news_id, r in rows])))
+                upsert(con, assoc, [row for news_id, r in rows for row in r])
+
+        upsert(con, ProcessedNews.__table__, processed)
+        con.execute(ExistingNews.__table__.delete().where(ExistingNews.__table__.c.id.in_(ids)))
+        self.rollups.after(con, ids, rollups)
+
+    def write_dimensions(self, con: Connection, batch: List[NEWS_DICT]):
+        """
+        Upsert types, categories and tags of news batch, which are not known to be present in database.
+        """
+        types = {t: {"name": t} for data in batch if (t := data.get("type", None)) is not None}
+        # Only provided fields are written, so that stored ones are not overwritten with NULL
+        categories = {}
+        tags = {}
+        for data in batch:
+            for c in data.get("categories", ()):
+                if "name" in c:
+                    categories.setdefault(c["name"], {}).update({k: c[k] for k in ("name", "full_name") if k in c})
+            for t in data.get("tags", ()):
+                if "id" in t:
+                    tags.setdefault(t["id"], {}).update({k: t[k] for k in ("id", "name") if k in t})
+        for table, rows in ((Type.__table__, types),
+                            (Category.__table__, categories),
+                            (Tag.__table__, tags)):
+            if rows:
+                self.dimensions.ensure(con, table, rows)
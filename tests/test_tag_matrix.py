@@ -0,0 +1,38 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from sqlalchemy.engine import URL
+
+from lib.frame_cache import FrameCache
+from lib.tag_matrix import TagMatrix, explode_tags
+
+
+def _news() -> pd.DataFrame:
+    return pd.DataFrame({
+        "id": [1, 2, 3, 4],
+        "date": pd.to_datetime([datetime.datetime(2021, 1, d) for d in (1, 2, 3, 4)]),
+        "tags": [["fire", "forest"], [], None, ["fire", "road", "forest"]],
+    })
+
+
+def test_explode_tags_of_arrays():
+    news = _news()
+    news['tags'] = [np.array(t) if t is not None else None for t in news['tags']]
+    long = explode_tags(news)
+    assert long['news_id'].tolist() == [1, 1, 4, 4, 4]
+    assert long['tag'].astype(str).tolist() == ["fire", "forest", "fire", "road", "forest"]
+    assert long['priority'].tolist() == [0, 1, 0, 1, 2]
+
+
+def test_matrix_of_reloaded_cache_frame(tmp_path):
+    cache = FrameCache(URL.create("sqlite", database="news"), str(tmp_path))
+    cache.save(_news(), {"max_id": 4, "max_date": None, "since": None, "rows": 4})
+    cached = cache.load()
+    assert isinstance(cached['tags'].iloc[0], list)
+
+    matrix = TagMatrix.from_frame(cached)
+    assert matrix.news_ids.tolist() == [1, 2, 3, 4]
+    assert matrix.frequency().to_dict() == {"fire": 2, "forest": 2, "road": 1}
+    assert matrix.mask(["fire", "road"], how="all").tolist() == [False, False, False, True]
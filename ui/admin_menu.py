@@ -1,11 +1,13 @@
 from typing import *
 
 from sqlalchemy.engine import Engine, URL
-from sqlalchemy import create_engine, inspect, schema
+from sqlalchemy import inspect, schema
 
 from PyQt5.QtCore import Qt, QSignalBlocker
 from PyQt5.QtWidgets import QWidget, QLabel, QLineEdit, QVBoxLayout, QFormLayout, QDialog, QDialogButtonBox
 
+from lib import engines
+
 from . import ui_utils
 
 if not ui_utils.LOAD_UI:
@@ -26,7 +28,7 @@ class AdminMenu(Ui_AdminMenu, QWidget):
     def __init__(self, updater: "Updater", url: URL):
         super().__init__()
         self.updater = updater
-        self._engine: Engine = create_engine(url)
+        self._engine: Engine = engines.get_engine(url)
         self.setupUi(self)
 
         self.postfix = self.windowTitle()
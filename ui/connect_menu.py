@@ -2,7 +2,9 @@ from typing import TYPE_CHECKING
 
 from PyQt5.QtCore import QSignalBlocker
 from PyQt5.QtWidgets import QWidget
-from sqlalchemy.engine import create_engine, URL
+from sqlalchemy.engine import URL
+
+from lib import engines
 
 from . import ui_utils
 from .error_dialog import raise_exc_dialog
@@ -87,8 +89,7 @@ class ConnectMenu(Ui_ConnectMenu, QWidget):
                 password=self.valuePassword.text() if self.valuePassword.text() else None,
                 host=host, port=port,
                 database=schema_name)
-            with create_engine(url).connect():
-                pass
+            engines.check_engine(url)
             self.main.connect(url, self.role)
         except BaseException:
             raise_exc_dialog()
@@ -0,0 +1,83 @@
+"""
+Background jobs of UI, executed in their own thread pool with progress and cancellation.
+"""
+from typing import *
+import sys
+
+from PyQt5.QtCore import QObject, QRunnable, QThread, QThreadPool, pyqtSignal as Signal
+
+__all__ = ["JobCancelled", "Job"]
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job(QObject):
+    """
+    Function executed in a pool thread, called with the job itself to report progress.
+    Cancellation is cooperative: report() raises JobCancelled in cancelled job,
+    result of job, that can't be interrupted, is discarded.
+    Signals are delivered to receivers in GUI thread.
+    Jobs have a thread pool of their own, so that they don't wait for updates in global one and vice versa.
+    """
+    _pool: Optional[QThreadPool] = None
+
+    def __init__(self, func: Callable[["Job"], Any], description: str = ""):
+        super().__init__()
+        self.func = func
+        self.description = description
+        self._cancelled = False
+
+    progress = Signal(int)
+    finished = Signal(object)
+    failed = Signal([object, object, object])
+    cancelled = Signal()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self):
+        self._cancelled = True
+
+    def report(self, n: int):
+        """
+        Report progress (e.g. number of loaded rows) from job function.
+        """
+        if self._cancelled:
+            raise JobCancelled()
+        self.progress.emit(n)
+
+    @classmethod
+    def pool(cls) -> QThreadPool:
+        if cls._pool is None:
+            cls._pool = QThreadPool()
+            cls._pool.setMaxThreadCount(max(QThread.idealThreadCount(), 2))
+        return cls._pool
+
+    def start(self):
+        self.pool().start(_JobRunnable(self))
+
+    def run(self):
+        try:
+            result = self.func(self)
+        except JobCancelled:
+            self.cancelled.emit()
+        except BaseException:
+            self.failed.emit(*sys.exc_info())
+        else:
+            if self._cancelled:
+                self.cancelled.emit()
+            else:
+                self.finished.emit(result)
+
+
+class _JobRunnable(QRunnable):
+
+    def __init__(self, job: Job):
+        super().__init__()
+        self.job = job
+
+    def run(self):
+        self.job.run()
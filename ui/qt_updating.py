@@ -68,6 +68,7 @@ class QtMCHSUpdater(MCHSUpdater, QObject):
     update_started = Signal()
 
     def all_finished(self):
+        super().all_finished()
         self.update_finished.emit()
 
     update_finished = Signal()
@@ -108,7 +109,7 @@ class MCHSUpdate(QRunnable):
             nu.news_failed.connect(uw.news_failed)
             nu.news_successful.connect(uw.news_successful)
             nu.update_finished.connect(uw.update_finished)
-        nu.update_finished.connect(self._updater._update_finished)
+        nu.update_finished.connect(self._updater.signals.update_finished)
         nu.update_range("date", *self._range, **self._kwargs)
         self._news_updater = nu
         nu.run_all()
@@ -64,7 +64,7 @@ class ScheduleFileStore:
         schedule.sort(key=lambda rec: rec[0])
         return schedule
 
-    def dump(self, schedule: List["UPDATE_RECORD"]):
+    def dump(self, schedule: Iterable["UPDATE_RECORD"]):
         dump_line = self._dump_update_record
         with open(self.file, mode='w') as f:
             for upd in sorted(schedule, key=lambda rec: rec[0]):
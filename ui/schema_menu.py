@@ -6,12 +6,12 @@ import csv
 from sqlalchemy.sql.expression import func
 from sqlalchemy.engine import Engine, URL
 from sqlalchemy.orm import Session
-from sqlalchemy import create_engine, inspect, MetaData
+from sqlalchemy import inspect, MetaData
 
 from PyQt5.QtCore import Qt, QSignalBlocker
-from PyQt5.QtWidgets import QGroupBox, QTableWidgetItem, QFileDialog
+from PyQt5.QtWidgets import QGroupBox, QTableWidgetItem, QFileDialog, QMessageBox
 
-from lib import db
+from lib import db, migrations, engines
 from lib.date_utils import MCHS_TZ
 
 from . import ui_utils
@@ -34,7 +34,7 @@ class SchemaMenu(Ui_SchemaMenu, QGroupBox):
     def __init__(self, updater: "Updater", url: URL = None):
         super().__init__()
         self.updater = updater
-        self._engine: Engine = create_engine(url) if url else None
+        self._engine: Engine = engines.get_engine(url) if url else None
         self._schedule: List["UPDATE_RECORD"] = []
         self.setupUi(self)
         self.tabWidget.setCurrentIndex(0)
@@ -51,6 +51,7 @@ class SchemaMenu(Ui_SchemaMenu, QGroupBox):
         self.buttonImportTable.clicked.connect(lambda: self.import_table())
         self.buttonCreateAllTables.clicked.connect(self.create_tables)
         self.buttonDeleteAllTables.clicked.connect(self.delete_tables)
+        self.buttonMigrateTables.clicked.connect(self.migrate_tables)
 
         # Update controls
         self.checkUpdateToLast.stateChanged.connect(lambda state: self.valueUpdateDateA.setEnabled(not state))
@@ -101,7 +102,7 @@ class SchemaMenu(Ui_SchemaMenu, QGroupBox):
     def schema(self, name: Optional[str]):
         name = name if name else None
         if self._engine:
-            self._engine = create_engine(self._engine.url._replace(database=name))
+            self._engine = engines.get_engine(self._engine.url.set(database=name))
         elif name:
             raise RuntimeError("Cannot change schema without engine specified.")
 
@@ -111,6 +112,7 @@ class SchemaMenu(Ui_SchemaMenu, QGroupBox):
         self.tabWidget.setEnabled(bool(name))
         self.buttonRefreshTables.setEnabled(bool(name))
         self.buttonCreateAllTables.setEnabled(bool(name))
+        self.buttonMigrateTables.setEnabled(bool(name))
 
     @property
     def selected_table(self) -> str:
@@ -169,6 +171,24 @@ class SchemaMenu(Ui_SchemaMenu, QGroupBox):
         db.Base.metadata.drop_all(self._engine)
         self.refresh_tables()
 
+    def migrate_tables(self):
+        if not inspect(self._engine).has_table(db.News.__tablename__):
+            raise RuntimeError("MCHS Media tables should be created before migration.")
+        if not migrations.pending_migrations(self._engine):
+            QMessageBox.information(self, self.tr("Migrate"), self.tr("Schema is up to date."))
+            return
+        before = migrations.benchmark(self._engine)
+        applied = migrations.migrate(self._engine)
+        after = migrations.benchmark(self._engine)
+        self.refresh_tables()
+        QMessageBox.information(
+            self, self.tr("Migrate"),
+            '\n'.join([self.tr("Applied migrations:"),
+                       *(f"{m.version}. {m.description}" for m in applied),
+                       "",
+                       self.tr("Query time before / after, ms:"),
+                       *(f"{k}: {before[k] * 1000:.1f} / {after[k] * 1000:.1f}" for k in before)]))
+
     def _check_table(self, name: str = None):
         if name is None:
             name = self.selected_table
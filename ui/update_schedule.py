@@ -0,0 +1,122 @@
+"""
+Schedule of updates in heaps of users by start time.
+"""
+from typing import *
+import collections
+import datetime
+import heapq
+import itertools as it
+
+if TYPE_CHECKING:
+    from .updater import UPDATE_RECORD
+
+__all__ = ["UpdateSchedule"]
+
+
+class UpdateSchedule:
+    """
+    Update records in heaps of their users by start time, iterated in start time order.
+    Add is O(log n), remove is O(1): removed entries are dropped when they reach the top of heap
+    or when they outnumber scheduled ones.
+    """
+
+    def __init__(self, records: Iterable["UPDATE_RECORD"] = ()):
+        # Entries are (start time, order of adding, record), order breaks ties of records with None edges
+        self._heaps: Dict[str, List[Tuple[datetime.datetime, int, "UPDATE_RECORD"]]] = {}
+        self._order = it.count()
+        # Scheduled copies of records and removed copies left in heaps
+        self._counts: Counter["UPDATE_RECORD"] = collections.Counter()
+        self._removed: Counter["UPDATE_RECORD"] = collections.Counter()
+        self._len = 0
+        self._n_removed = 0
+        for upd in records:
+            self.add(upd)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __contains__(self, upd: "UPDATE_RECORD") -> bool:
+        return self._counts[upd] > 0
+
+    def __iter__(self) -> Iterator["UPDATE_RECORD"]:
+        return iter(sorted(self._counts.elements(), key=lambda rec: rec[0]))
+
+    def users(self) -> Set[str]:
+        return {upd[4] for upd in self._counts}
+
+    def add(self, upd: "UPDATE_RECORD"):
+        heapq.heappush(self._heaps.setdefault(upd[4], []), (upd[0], next(self._order), upd))
+        self._counts[upd] += 1
+        self._len += 1
+
+    def remove(self, upd: "UPDATE_RECORD"):
+        if self._counts[upd] <= 0:
+            raise ValueError(f"Update {upd} is not scheduled.")
+        self._counts[upd] -= 1
+        if not self._counts[upd]:
+            del self._counts[upd]
+        self._removed[upd] += 1
+        self._len -= 1
+        self._n_removed += 1
+        if self._n_removed > self._len:
+            self._compact()
+
+    def _compact(self):
+        heaps = {}
+        for upd in self._counts.elements():
+            heaps.setdefault(upd[4], []).append((upd[0], next(self._order), upd))
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        self._heaps = heaps
+        self._removed.clear()
+        self._n_removed = 0
+
+    def _top(self, user: str) -> Optional["UPDATE_RECORD"]:
+        heap = self._heaps.get(user, None)
+        while heap:
+            upd = heap[0][2]
+            if not self._removed[upd]:
+                return upd
+            heapq.heappop(heap)
+            self._removed[upd] -= 1
+            if not self._removed[upd]:
+                del self._removed[upd]
+            self._n_removed -= 1
+        if heap is not None:
+            del self._heaps[user]
+        return None
+
+    def first(self, users: Iterable[str] = None) -> Optional["UPDATE_RECORD"]:
+        """
+        The earliest record of users (of all users by default).
+        """
+        tops = [self._top(user) for user in (list(self._heaps) if users is None else users)]
+        return min((upd for upd in tops if upd is not None), key=lambda rec: rec[0], default=None)
+
+    def due(self, now: datetime.datetime, users: Iterable[str] = None) -> List["UPDATE_RECORD"]:
+        """
+        Records of users (of all users by default) with start time at or before now, in start time order.
+        """
+        found = set()
+        for user in (list(self._heaps) if users is None else users):
+            heap = self._heaps.get(user, ())
+            # Entries below a later one are later too
+            stack = [0] if heap else []
+            while stack:
+                i = stack.pop()
+                if heap[i][0] <= now:
+                    found.add(heap[i][2])
+                    stack.extend(c for c in (2 * i + 1, 2 * i + 2) if c < len(heap))
+        return sorted((upd for upd in found if upd in self for _ in range(self._counts[upd])),
+                      key=lambda rec: rec[0])
+
+    def sync(self, records: Iterable["UPDATE_RECORD"]):
+        """
+        Make schedule equal to records, adding and removing only the changed ones.
+        """
+        records = collections.Counter(records)
+        removed, added = self._counts - records, records - self._counts
+        for upd in removed.elements():
+            self.remove(upd)
+        for upd in added.elements():
+            self.add(upd)
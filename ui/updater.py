@@ -1,14 +1,18 @@
 from typing import *
 import datetime
+import os
 
-from PyQt5.QtCore import Qt, QThreadPool, QTimer
+from PyQt5.QtCore import Qt, QObject, QThreadPool, QTimer, QFileSystemWatcher, pyqtSignal as Signal
 from sqlalchemy.engine import URL
 
 import utils
 
+from lib import engines
+
 from . import app_config
 
 from .schedule_store import ScheduleFileStore
+from .update_schedule import UpdateSchedule
 from .qt_updating import MCHSUpdate
 from .updater_ui import UpdateWindow, TrayIcon
 from .main_window import MainWindow
@@ -21,6 +25,16 @@ UPDATE_RECORD = Tuple[datetime.datetime,
                       Optional[datetime.datetime], Optional[datetime.datetime],
                       str, str]
 
+# Longest wait of update timer, so that wall clock and updates of not registered users are rechecked
+MAX_UPDATE_WAIT = 10 * 60 * 1000
+
+
+class UpdaterSignals(QObject):
+    """
+    Signals of Updater, which is not a QObject, emitted in update threads and received in GUI thread.
+    """
+    update_finished = Signal()
+
 
 class Updater:
 
@@ -31,27 +45,42 @@ class Updater:
 
         self.tray_icon = TrayIcon(self)
 
+        # Timers and windows are handled in GUI thread, where signals are created
+        self.signals = UpdaterSignals()
+        self.signals.update_finished.connect(self._update_finished, Qt.QueuedConnection)
+
         self.schedule_store = ScheduleFileStore(utils.PATH.SCHEDULE)
-        self.schedule: List[UPDATE_RECORD] = self.schedule_store.refresh()
+        self.schedule = UpdateSchedule(self.schedule_store.refresh())
 
+        # Armed for the next due update by check_updates
         self._update_timer = QTimer()
         self._update_timer.setTimerType(Qt.VeryCoarseTimer)
-        self._update_timer.setInterval(10 * 1000)
+        self._update_timer.setSingleShot(True)
         self._update_timer.timeout.connect(self.check_updates)
 
+        # Schedule file is reloaded once after a burst of changes
         self._refresh_timer = QTimer()
-        self._refresh_timer.setTimerType(Qt.VeryCoarseTimer)
-        self._refresh_timer.setInterval(5 * 60 * 1000)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(500)
         self._refresh_timer.timeout.connect(self.refresh_updates)
 
+        self._schedule_watcher = QFileSystemWatcher()
+        self._schedule_watcher.fileChanged.connect(self._schedule_changed)
+        self._schedule_watcher.directoryChanged.connect(self._schedule_changed)
+        self._watch_schedule()
+
+        self._engines_timer = QTimer()
+        self._engines_timer.setTimerType(Qt.VeryCoarseTimer)
+        self._engines_timer.setInterval(60 * 1000)
+        self._engines_timer.timeout.connect(engines.dispose_idle)
+
         self.update_window: Optional[UpdateWindow] = None
         self.update: Optional[MCHSUpdate] = None
         self.main_window: Optional[MainWindow] = None
 
         self.tray_icon.show()
         self.check_updates()
-        self._update_timer.start()
-        self._refresh_timer.start()
+        self._engines_timer.start()
 
     def register_user(self, url: URL):
         self._urls[url.username] = url
@@ -72,29 +101,52 @@ class Updater:
             now = datetime.datetime.now(tz=datetime.timezone.utc)
             app = app_config.get_app()
             urls = self._urls
-            unauthorized = self._unauthorized
-
-            for n, upd in enumerate(sorted(self.schedule, key=lambda rec: rec[0])):
-                if now >= upd[0]:
-                    if (url := urls.get(upd[4], None)) is not None:
-                        self.start_update(url.set(database=upd[3]), end=upd[2], start=upd[1])
-                        self.tray_icon.showMessage(app.tr("Starting update"),
-                                                   self.update_string(upd))
-                        del self.schedule[n]
-                        self.schedule_store.dump(self.schedule)
-                        if upd in unauthorized:
-                            unauthorized.remove(upd)
-                            if upd in self._warned:
-                                self._warned.remove(upd)
-                        break
-                    else:
-                        unauthorized.add(upd)
-                else:
-                    break
+
+            if (upd := self.schedule.first(urls)) is not None and now >= upd[0]:
+                self.start_update(urls[upd[4]].set(database=upd[3]), end=upd[2], start=upd[1])
+                self.tray_icon.showMessage(app.tr("Starting update"),
+                                           self.update_string(upd))
+                self.schedule.remove(upd)
+                self.schedule_store.dump(self.schedule)
+            self._unauthorized = set(self.schedule.due(now, self.schedule.users() - urls.keys()))
+            self._warned &= self._unauthorized
             self.warn_unauthorized_updates(force=False)
+        self._arm_update_timer()
+
+    def _arm_update_timer(self):
+        """
+        Start update timer for the next due update, it is not needed while an update is in progress.
+        """
+        self._update_timer.stop()
+        if self.update is not None or not self.schedule:
+            return
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        wait = MAX_UPDATE_WAIT
+        for upd in (self.schedule.first(self._urls), self.schedule.first()):
+            if upd is not None and upd[0] > now:
+                wait = min(wait, int((upd[0] - now).total_seconds() * 1000) + 1)
+        self._update_timer.start(wait)
+
+    def _watch_schedule(self):
+        # Watched file is dropped by watcher when it is replaced, directory is watched until file is created
+        watcher = self._schedule_watcher
+        file = os.path.abspath(self.schedule_store.file)
+        directory = os.path.dirname(file)
+        if os.path.isfile(file):
+            if file not in watcher.files():
+                watcher.addPath(file)
+            if directory in watcher.directories():
+                watcher.removePath(directory)
+        elif os.path.isdir(directory) and directory not in watcher.directories():
+            watcher.addPath(directory)
+
+    def _schedule_changed(self, path: str):
+        self._watch_schedule()
+        self._refresh_timer.start()
 
     def refresh_updates(self):
-        self.schedule = self.schedule_store.refresh()
+        self.schedule.sync(self.schedule_store.refresh())
+        self.check_updates()
 
     @staticmethod
     def update_string(upd: UPDATE_RECORD):
@@ -102,16 +154,14 @@ class Updater:
 
     def schedule_update(self, url: URL, /, dt: datetime.datetime,
                         end: Optional[datetime.datetime] = None, start: Optional[datetime.datetime] = None):
-        self.schedule.append((dt, start, end, url.database, url.username))
+        self.schedule.add((dt, start, end, url.database, url.username))
         self.schedule_store.dump(self.schedule)
         self.register_user(url)
 
     def cancel_update(self, upd: UPDATE_RECORD):
-        check = upd == self.schedule[0]
         self.schedule.remove(upd)
         self.schedule_store.dump(self.schedule)
-        if check:
-            self.check_updates()
+        self.check_updates()
 
     def start_update(self, url: URL, /,
                      end: Optional[datetime.datetime] = None, start: Optional[datetime.datetime] = None):
@@ -134,6 +184,7 @@ class Updater:
                                    f"{upd.url.database}:{upd.url.username} ({rng[0]}-{rng[1]})")
         del self.update
         self.update = None
+        self.check_updates()
 
     def open_status(self):
         if self.update and self.update_window:
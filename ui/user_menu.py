@@ -1,19 +1,23 @@
 from typing import *
 import itertools as it
+import datetime
+import logging
 
 from sqlalchemy.engine import URL
 
 import numpy as np
 import pandas as pd
 
-import plotly.offline
-import plotly.express
-import plotly
+from PyQt5.QtCore import Qt, QDate
+from PyQt5.QtWidgets import QWidget, QLabel, QComboBox, QLineEdit, QFileDialog
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QWidget, QLabel, QComboBox, QFileDialog
-
-from lib import analysis
+from lib.frame_cache import FrameCache
+from lib import aggregation
+from lib.analysis import NewsFilter, memory_footprint, compact, read_dataframe, page_key
+from lib.search import search
+from lib.db import News
+from lib.tag_matrix import TagMatrix
+from lib import rollups, engines, plotting
 
 from . import ui_utils
 
@@ -23,6 +27,17 @@ else:
     Ui_UserMenu = ui_utils.load_ui("UserMenu")
 
 from .user_menu_views import TableView, PlotView
+from .jobs import Job
+
+T = TypeVar("T")
+
+
+class NewsSource(NamedTuple):
+    """
+    News of the schema loaded into a table: first limit news (all if None) in news order, matching filters.
+    """
+    limit: Optional[int] = None
+    filters: Optional[NewsFilter] = None
 
 
 class UserMenu(Ui_UserMenu, QWidget):
@@ -30,6 +45,10 @@ class UserMenu(Ui_UserMenu, QWidget):
     def __init__(self, url: URL):
         super().__init__()
         self._tables: Dict[str, TableView] = {}
+        # Tables loaded straight from database, aggregated by database
+        self._news_sources: Dict[str, NewsSource] = {}
+        self._job: Optional[Job] = None
+        self._job_done: Optional[Callable[[Any], Any]] = None
 
         self.url = url
         self.setupUi(self)
@@ -47,14 +66,21 @@ class UserMenu(Ui_UserMenu, QWidget):
         for t_type in ("pivot", "contingency"):
             self.valueTableType.addItem(self.tr(t_type), t_type)
 
-        self.buttonRefreshNews.clicked.connect(lambda: self.set_table(
-            "news",
-            analysis.read_dataframe(self.url, limit=n if (n := self.valueLimitNews.value()) != -1 else None)[
-                ["id", "date", "title", "text", "type",
-                 "region", "city", "injuries", "n_staff", "n_tech",
-                 "tags", "area", "water"]
-            ]
-        ))
+        self.news_cache = FrameCache(self.url, columns=self.news_columns)
+        self.buttonCancelJob.clicked.connect(self.cancel_job)
+        self._end_job()
+        self.buttonRefreshNews.clicked.connect(self.ui_refresh_news)
+        self.buttonNextNews.clicked.connect(self.ui_next_news)
+        self.checkFilterDate.toggled.connect(self.valueDateFrom.setEnabled)
+        self.checkFilterDate.toggled.connect(self.valueDateTo.setEnabled)
+        self.checkFilterDate.toggled.emit(self.checkFilterDate.isChecked())
+        self.valueDateTo.setDate(QDate.currentDate())
+        self.valueDateFrom.setDate(QDate.currentDate().addMonths(-1))
+        for grain in rollups.ROLLUP_GRAINS:
+            self.valueRollupGrain.addItem(self.tr(grain), grain)
+        self.buttonLoadRollups.clicked.connect(self.ui_load_rollups)
+        self.valueSearchNews.returnPressed.connect(self.ui_search_news)
+        self.buttonSearchNews.clicked.connect(self.ui_search_news)
 
         self.valueTableSource.currentTextChanged.connect(self._set_table_controls)
         self.valueTableType.currentIndexChanged.connect(
@@ -63,6 +89,10 @@ class UserMenu(Ui_UserMenu, QWidget):
         self.buttonTable.clicked.connect(self.ui_create_table)
 
         self.tabWidgetTables.currentChanged.connect(lambda i: self.buttonTableExport.setDisabled(i == -1))
+        self.tabWidgetTables.currentChanged.connect(self._set_filter_controls)
+        self.valueTableFilter.returnPressed.connect(self.ui_filter_table)
+        # Cleared filter is applied at once
+        self.valueTableFilter.textChanged.connect(lambda t: t or self.ui_filter_table())
         self.tabWidgetTables.tabCloseRequested.connect(
             lambda i: self.delete_table(
                 next(k for k, v in self._tables.items() if v is self.tabWidgetTables.widget(i))
@@ -155,10 +185,23 @@ class UserMenu(Ui_UserMenu, QWidget):
                 label.setText(arg)
                 value.setHidden(arg is None)
 
+    # Columns of news table, others are not loaded
+    news_columns = ["id", "date", "title", "text", "type",
+                    "region", "city", "injuries", "n_staff", "n_tech",
+                    "tags", "area", "water"]
+
+    # Columns of news added to their tags in news_tags table
+    news_tags_columns = ["id", "date", "type", "region", "city", "injuries", "n_staff", "n_tech"]
+
     # TODO TRANSLATIONS
-    def set_table(self, name: str, table: pd.DataFrame):
+    def set_table(self, name: str, table: pd.DataFrame, news_source: NewsSource = None):
+        """
+        :param news_source: news of the schema in table, if it is news frame.
+        """
         if name in self._tables:
             self.delete_table(name)
+        if news_source is not None:
+            self._news_sources[name] = news_source
         tv = TableView(table)
         self._tables[name] = tv
         self.tabWidgetTables.addTab(tv, name)
@@ -172,30 +215,206 @@ class UserMenu(Ui_UserMenu, QWidget):
         self.tabWidgetTables.removeTab(
             self.tabWidgetTables.indexOf(
                 self._tables.pop(name)))
+        self._news_sources.pop(name, None)
         for i in (self.valueTableSource, self.valuePlotTable):
             i.removeItem(i.findText(name))
 
     def create_plot(self, figure, name: Optional[str] = None):
         self.tabWidgetPlots.addTab(PlotView(figure), name if name is not None else "")
 
+    def news_filter(self) -> Optional[NewsFilter]:
+        """
+        Filter set by news controls, None if none are set.
+        """
+
+        def names(edit: QLineEdit) -> Optional[List[str]]:
+            return [name for v in edit.text().split(",") if (name := v.strip())] or None
+
+        date_from = date_to = None
+        if self.checkFilterDate.isChecked():
+            date_from = datetime.datetime.combine(self.valueDateFrom.date().toPyDate(), datetime.time())
+            # Including the whole last day
+            date_to = datetime.datetime.combine(self.valueDateTo.date().toPyDate(), datetime.time()) \
+                + datetime.timedelta(days=1)
+        filters = NewsFilter(date_from, date_to,
+                             names(self.valueFilterTypes),
+                             names(self.valueFilterRegions),
+                             names(self.valueFilterCategories))
+        return filters if any(v is not None for v in filters) else None
+
+    def run_job(self, description: str, func: Callable[[Job], T], done: Callable[[T], Any]):
+        """
+        Execute func in background thread, showing its progress, and pass its result to done in GUI thread.
+        Only one job is executed at a time.
+        :param func: called with job to report progress (number of rows) and check for cancellation.
+        """
+        if self._job is not None:
+            raise ValueError(f"Wait until {self._job.description} is finished or cancel it.")
+        job = self._job = Job(func, description)
+        self._job_done = done
+        job.progress.connect(self._job_progress)
+        job.finished.connect(self._job_finished)
+        job.failed.connect(self._job_failed)
+        job.cancelled.connect(self._end_job)
+        self.labelJob.setText(self.tr(description))
+        for i in (self.labelJob, self.progressJob, self.buttonCancelJob):
+            i.setHidden(False)
+        self.buttonCancelJob.setEnabled(True)
+        job.start()
+
+    def cancel_job(self):
+        if self._job is not None:
+            self._job.cancel()
+            self.buttonCancelJob.setEnabled(False)
+            self.labelJob.setText(self.tr("{} (cancelling)").format(self.tr(self._job.description)))
+
+    def _job_progress(self, n: int):
+        if self._job is not None:
+            self.labelJob.setText(self.tr("{}: {} rows").format(self.tr(self._job.description), n))
+
+    def _job_finished(self, result):
+        done = self._job_done
+        self._end_job()
+        done(result)
+
+    def _job_failed(self, exc_type: Type[BaseException], exc_value: BaseException, exc_traceback):
+        self._end_job()
+        raise exc_value.with_traceback(exc_traceback)
+
+    def _end_job(self):
+        self._job = None
+        self._job_done = None
+        for i in (self.labelJob, self.progressJob, self.buttonCancelJob):
+            i.setHidden(True)
+
+    def ui_refresh_news(self):
+        limit = n if (n := self.valueLimitNews.value()) != -1 else None
+        filters = self.news_filter()
+        cache = self.news_cache
+        url = self.url
+
+        def load(job: Job):
+            if filters is None:
+                news = cache.refresh(job.report)
+                if limit is not None:
+                    news = news.sort_values(["date", "id"], ascending=False, na_position="last").head(limit)
+                    for name in news.select_dtypes("category").columns:
+                        news[name] = news[name].cat.remove_unused_categories()
+            else:
+                news = read_dataframe(url, limit, filters=filters, columns=self.news_columns, progress=job.report)
+            return self._news_tables(news.reset_index(drop=True))
+
+        self.run_job("Loading news", load, lambda tables: self._set_news(*tables, NewsSource(limit, filters)))
+
+    def ui_next_news(self):
+        """
+        Append the next page of news after the last news in news table.
+        """
+        if (source := self._news_sources.get("news", None)) is None:
+            raise ValueError("News are not loaded yet.")
+        if source.limit is None:
+            return
+        news = self._tables["news"].table
+        limit = n if (n := self.valueLimitNews.value()) != -1 else None
+        url = self.url
+
+        def load(job: Job):
+            page = read_dataframe(url, limit, filters=source.filters, after=page_key(news),
+                                  columns=self.news_columns, progress=job.report)
+            return self._news_tables(compact(pd.concat([news, page], ignore_index=True)))
+
+        self.run_job("Loading news", load,
+                     lambda tables: self._set_news(*tables, NewsSource(len(tables[0]), source.filters)))
+
+    @classmethod
+    def _news_tables(cls, news: pd.DataFrame) -> Tuple[pd.DataFrame, TagMatrix, pd.DataFrame]:
+        """
+        News table, tag matrix and news with one row per tag, for pivots and plots by tag.
+        """
+        news = news[cls.news_columns]
+        matrix = TagMatrix.from_frame(news)
+        tags = matrix.long().merge(news[cls.news_tags_columns], left_on="news_id", right_on="id") \
+            .drop(columns="news_id")
+        return news, matrix, tags[["id", "tag", *cls.news_tags_columns[1:]]]
+
+    def _set_news(self, news: pd.DataFrame, matrix: TagMatrix, tags: pd.DataFrame, source: NewsSource):
+        self.set_table("news", news, source)
+        footprint = memory_footprint(news)
+        self.tabWidgetTables.setTabToolTip(
+            self.tabWidgetTables.indexOf(self._tables["news"]),
+            self.tr("{} rows, {:.1f} MiB").format(len(news), footprint["total"] / 2 ** 20))
+        logging.getLogger("UI").debug(f"News table memory footprint (bytes):\n{footprint}")
+        self.news_tags = matrix
+        self.set_table("news_tags", tags)
+
+    def ui_search_news(self):
+        if not (query := self.valueSearchNews.text().strip()):
+            raise ValueError(f"Search query can't be empty.")
+        limit = n if (n := self.valueLimitNews.value()) != -1 else None
+        url = self.url
+
+        def load(job: Job):
+            found = search(url, query, limit=limit)
+            job.report(len(found))
+            news = read_dataframe(url, where=News.__table__.c.id.in_(found['id'].tolist()),
+                                  columns=self.news_columns, progress=job.report)
+            news = news.merge(found[["id", "score", "snippet"]], on="id") \
+                .sort_values("score", ascending=False, kind="stable") \
+                .reset_index(drop=True)
+            return news[["id", "score", "snippet", *self.news_columns[1:]]]
+
+        def done(news: pd.DataFrame):
+            self.set_table("search", news)
+            self.select_table("search")
+
+        self.run_job("Searching news", load, done)
+
+    def ui_load_rollups(self):
+        grain = self.valueRollupGrain.currentData()
+        url = self.url
+
+        def load(job: Job):
+            if not rollups.has_rollups(engines.get_engine(url)):
+                raise ValueError("Schema has no rollups table, migrate it first.")
+            return rollups.read_rollups(url, grain)
+
+        self.run_job("Loading rollups", load, lambda table: self.set_table(f"rollups_{grain}", table))
+
     def ui_create_table(self):
         if not (name := self.valueTableName.text()):
             raise ValueError(f"Table name can't be empty.")
-        source = self._tables[self.valueTableSource.currentText()].table
+        source_name = self.valueTableSource.currentText()
+        source = self._tables[source_name].table
         t_type = self.valueTableType.currentData()
         rows = self.valueTableRows.currentData()
         cols = self.valueTableColumns.currentData()
-        if t_type == 'pivot':
-            table = pd.pivot_table(source, values=self.valueTableValues.currentData(), index=rows, columns=cols)
-        elif t_type == 'contingency':
-            table = pd.crosstab(source[rows], source[cols])
-        else:
+        values = self.valueTableValues.currentData()
+        # News of the schema are aggregated by database, derived tables by pandas
+        news_source = self._news_sources.get(source_name, None)
+        push_down = news_source is not None
+        url = self.url
+
+        def create(job: Job):
+            if t_type == 'pivot':
+                if push_down and values is not None and aggregation.can_aggregate((rows, cols), values):
+                    return aggregation.pivot_table(url, values, rows, cols,
+                                                   limit=news_source.limit, filters=news_source.filters)
+                return pd.pivot_table(source, values=values, index=rows, columns=cols, observed=True)
+            elif t_type == 'contingency':
+                if push_down and aggregation.can_aggregate((rows, cols)):
+                    return aggregation.crosstab(url, rows, cols,
+                                                limit=news_source.limit, filters=news_source.filters)
+                return pd.crosstab(source[rows], source[cols])
             raise ValueError(f"Invalid table type {t_type}.")
-        self.set_table(name, table)
-        self.select_table(name)
+
+        def done(table: pd.DataFrame):
+            self.set_table(name, table)
+            self.select_table(name)
+
+        self.run_job("Creating table", create, done)
 
     def ui_plot(self):
-        table = self._tables[self.valuePlotTable.currentText()].table.replace({pd.NA: np.nan})
+        source = self._tables[self.valuePlotTable.currentText()].table
         p_type = self.valuePlotType.currentData()
         name = self.valuePlotName.text()
         plot_args = {arg: value.currentData() for arg, (label, value) in
@@ -203,17 +422,35 @@ class UserMenu(Ui_UserMenu, QWidget):
                          self.plot_arguments[p_type] is not None else
                          self.plot_arguments_default,
                          self.plot_var_widgets)}
-        if 'size' in plot_args:
-            table.fillna({plot_args['size']: 0}, inplace=True)
-        if p_type == 'pie':
-            fig = plotly.express.pie(table, **plot_args)
-        else:
-            fig = plotly.plot(table, p_type, **plot_args)
-        self.create_plot(fig, name)
-        for i in range(self.tabWidgetPlots.count()):
-            if getattr(self.tabWidgetPlots.widget(i), "figure", None) == fig:
-                self.tabWidgetPlots.setCurrentIndex(i)
-                break
+
+        def create(job: Job):
+            table = source.replace({pd.NA: np.nan})
+            if 'size' in plot_args:
+                table.fillna({plot_args['size']: 0}, inplace=True)
+            return plotting.figure(table, p_type, **plot_args)
+
+        def done(result):
+            fig, note = result
+            self.create_plot(fig, name)
+            for i in range(self.tabWidgetPlots.count()):
+                if getattr(self.tabWidgetPlots.widget(i), "figure", None) is fig:
+                    self.tabWidgetPlots.setCurrentIndex(i)
+                    if note is not None:
+                        self.tabWidgetPlots.setTabText(i, f"{self.tabWidgetPlots.tabText(i)} *")
+                        self.tabWidgetPlots.setTabToolTip(i, self.tr("Aggregated: {}").format(note))
+                    break
+
+        self.run_job("Plotting", create, done)
+
+    def _set_filter_controls(self, i: int):
+        w = self.tabWidgetTables.widget(i)
+        self.valueTableFilter.setEnabled(isinstance(w, TableView))
+        self.valueTableFilter.setText(w.filter if isinstance(w, TableView) else "")
+
+    def ui_filter_table(self):
+        if isinstance(w := self.tabWidgetTables.currentWidget(), TableView):
+            if (expression := self.valueTableFilter.text()) != w.filter:
+                w.set_filter(expression)
 
     def ui_export_table(self):
         if w := self.tabWidgetTables.currentWidget():
@@ -222,7 +459,7 @@ class UserMenu(Ui_UserMenu, QWidget):
                 d.setAcceptMode(QFileDialog.AcceptSave)
                 d.setAttribute(Qt.WA_QuitOnClose, False)
                 if d.exec_():
-                    w.table.to_csv(d.selectedFiles()[0])
+                    w.visible_table().to_csv(d.selectedFiles()[0])
 
     def ui_export_plot(self):
         if w := self.tabWidgetPlots.currentWidget():
@@ -1,28 +1,150 @@
 from typing import *
 import os
 
+import numpy as np
 import pandas as pd
 
 import plotly
+import plotly.io
+import plotly.offline
 
-from PyQt5.QtCore import Qt, QUrl
-from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem
-from PyQt5.QtWebEngineWidgets import QWebEngineView
+from PyQt5 import sip
+from PyQt5.QtCore import Qt, QUrl, QObject, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QShowEvent, QHideEvent
+from PyQt5.QtWidgets import QTableView, QWidget, QVBoxLayout
+from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage, QWebEngineProfile
 
 import utils
 
 
-class TableView(QTableWidget):
+def _header_text(label) -> str:
+    # Levels of MultiIndex label on separate lines
+    if isinstance(label, tuple):
+        return "\n".join(str(level) for level in label if not (isinstance(level, str) and not level))
+    return str(label)
+
+
+class DataFrameModel(QAbstractTableModel):
+    """
+    Read-only model of DataFrame. Cells are formatted on request of view, so only visible ones are.
+    Rows are sorted and filtered on the whole frame at once, model rows are mapped to frame positions.
+    """
+
+    def __init__(self, table: pd.DataFrame = None, parent: QObject = None):
+        super().__init__(parent)
+        self._table = table if table is not None else pd.DataFrame()
+        self._columns = [self._table.iloc[:, i].array for i in range(self._table.shape[1])]
+        self._numeric = [pd.api.types.is_numeric_dtype(self._table.dtypes.iloc[i])
+                         for i in range(self._table.shape[1])]
+        # Row numbers instead of labels of default index
+        self._row_labels = not pd.api.types.is_integer_dtype(self._table.index.dtype)
+        # Frame positions of filtered rows, in sort order
+        self._rows = np.arange(self._table.shape[0])
+        self._filtered = self._rows
+        self._filter = ""
+        self._sort: Optional[Tuple[int, bool]] = None
+
+    @property
+    def table(self) -> pd.DataFrame:
+        return self._table
+
+    def visible_table(self) -> pd.DataFrame:
+        """
+        Filtered rows of table in sort order.
+        """
+        return self._table.iloc[self._rows]
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._table.shape[1]
+
+    @staticmethod
+    def format(value) -> str:
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return ", ".join(str(v) for v in value)
+        if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+            return ""
+        return str(value)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.format(self._columns[index.column()][self._rows[index.row()]])
+        if role == Qt.TextAlignmentRole and self._numeric[index.column()]:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return _header_text(self._table.columns[section])
+        if self._row_labels:
+            return _header_text(self._table.index[self._rows[section]])
+        return str(self._rows[section] + 1)
+
+    def _sorted(self, rows: np.ndarray) -> np.ndarray:
+        if self._sort is None:
+            return rows
+        column, ascending = self._sort
+        values = self._table.iloc[rows, column].reset_index(drop=True)
+        try:
+            values = values.sort_values(ascending=ascending, kind="stable", na_position="last")
+        except (TypeError, ValueError):
+            # Not comparable values, e.g. tag lists or arrays, are sorted by their text
+            values = values.map(self.format).sort_values(ascending=ascending, kind="stable")
+        return rows[values.index.to_numpy()]
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.AscendingOrder):
+        """
+        Sort rows by column, negative column restores table order.
+        """
+        self.layoutAboutToBeChanged.emit()
+        try:
+            self._sort = (column, order == Qt.AscendingOrder) if column >= 0 else None
+            self._rows = self._sorted(self._filtered)
+        finally:
+            self.layoutChanged.emit()
+
+    @property
+    def filter(self) -> str:
+        return self._filter
+
+    def set_filter(self, expression: str):
+        """
+        Show only rows matching boolean expression of columns (see DataFrame.eval), e.g. "injuries > 0".
+        Empty expression shows all rows.
+        """
+        rows = np.arange(self._table.shape[0])
+        if expression := expression.strip():
+            try:
+                mask = self._table.eval(expression)
+            except Exception as exc:
+                raise ValueError(f"Invalid filter \"{expression}\": {exc}") from exc
+            if not isinstance(mask, pd.Series) or not pd.api.types.is_bool_dtype(mask.dtype):
+                raise ValueError(f"Filter \"{expression}\" is not a condition on rows.")
+            rows = rows[mask.fillna(False).to_numpy(dtype=np.bool_)]
+        self.beginResetModel()
+        try:
+            self._filter = expression
+            self._filtered = rows
+            self._rows = self._sorted(rows)
+        finally:
+            self.endResetModel()
+
+
+class TableView(QTableView):
 
     def __init__(self, table: pd.DataFrame = None):
         super().__init__()
+        # No sorting until header is clicked
+        self.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.setSortingEnabled(True)
         self.table = table
 
-    def update_header(self):
-        self.setHorizontalHeaderLabels([self.tr(str(col)) for col in self._table.columns])
-        if not pd.api.types.is_integer_dtype(self._table.index.dtype):
-            self.setVerticalHeaderLabels([self.tr(str(row)) for row in self._table.index])
-
     @property
     def table(self) -> Optional[pd.DataFrame]:
         return self._table
@@ -30,23 +152,119 @@ class TableView(QTableWidget):
     @table.setter
     def table(self, table: Optional[pd.DataFrame]):
         self._table = table
-        self.clear()
-        if table is not None:
-            height, width = table.shape
-            self.setRowCount(height)
-            self.setColumnCount(width)
-            self.update_header()
-            for y, (index, row) in enumerate(table.iterrows()):
-                for x, v in enumerate(row):
-                    item = QTableWidgetItem(str(v))
-                    item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-                    self.setItem(y, x, item)
+        self.setModel(DataFrameModel(table, self))
 
+    def model(self) -> DataFrameModel:
+        return super().model()
 
-class PlotView(QWebEngineView):
+    def visible_table(self) -> pd.DataFrame:
+        return self.model().visible_table()
+
+    @property
+    def filter(self) -> str:
+        return self.model().filter
+
+    def set_filter(self, expression: str):
+        self.model().set_filter(expression)
+
+
+_PLOT_TEMPLATE = """
+<html>
+    <head>
+        <meta charset="utf-8">
+        {plotly_js}
+        <style>html, body, #plot {{ margin: 0; width: 100%; height: 100%; overflow: hidden; }}</style>
+    </head>
+    <body>
+        <div id="plot"></div>
+        <script>
+            function render(figure) {{
+                if (figure === null) {{
+                    Plotly.purge("plot");
+                }} else {{
+                    Plotly.react("plot", figure.data || [], figure.layout || {{}}, {{responsive: true}});
+                }}
+            }}
+        </script>
+    </body>
+</html>
+"""
+
+
+class PlotHost(QObject):
+    """
+    Single web page, that loads plotly.js once and renders figures pushed as JSON with Plotly.react.
+    Its view is moved to the shown PlotView, so plots don't start renderers and hidden ones keep only JSON.
+    """
+    _instance: Optional["PlotHost"] = None
+
+    @classmethod
+    def instance(cls) -> "PlotHost":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        super().__init__()
+        self.profile = QWebEngineProfile(self)
+        self.page = QWebEnginePage(self.profile, self)
+        self._view: Optional[QWebEngineView] = None
+        self._ready = False
+        # JSON of figure rendered (or to be rendered, when page is loaded)
+        self._figure_json: Optional[str] = None
+        self.page.loadFinished.connect(self._loaded)
+        if os.path.isfile(utils.PATH.PLOTLY_JS):
+            src = os.path.relpath(utils.PATH.PLOTLY_JS, os.path.dirname(utils.PATH.PLOT))
+            self.page.setHtml(_PLOT_TEMPLATE.format(plotly_js=f'<script src="{src}"></script>'),
+                              QUrl.fromLocalFile(utils.PATH.PLOT))
+        else:
+            # Inline plotly.js exceeds size limit of setHtml
+            with open(utils.PATH.PLOT, mode='w', encoding='utf-8') as f:
+                f.write(_PLOT_TEMPLATE.format(plotly_js=f"<script>{plotly.offline.get_plotlyjs()}</script>"))
+            self.page.load(QUrl.fromLocalFile(utils.PATH.PLOT))
+
+    @property
+    def view(self) -> QWebEngineView:
+        # View is deleted with PlotView it was left in, the page is kept by host
+        if self._view is None or sip.isdeleted(self._view):
+            self._view = QWebEngineView()
+            self._view.setPage(self.page)
+        return self._view
+
+    def _loaded(self, ok: bool):
+        self._ready = ok
+        if ok and self._figure_json is not None:
+            self.page.runJavaScript(f"render({self._figure_json});")
+
+    def show(self, plot: "PlotView"):
+        """
+        Move view to plot and render its figure, unless it is already rendered.
+        """
+        view = self.view
+        if view.parent() is not plot:
+            plot.layout().addWidget(view)
+        view.show()
+        if plot.figure_json is not self._figure_json:
+            self._figure_json = plot.figure_json
+            if self._ready:
+                self.page.runJavaScript(f"render({self._figure_json});")
+
+    def hide(self, plot: "PlotView"):
+        if self._view is not None and not sip.isdeleted(self._view) and self._view.parent() is plot:
+            plot.layout().removeWidget(self._view)
+            self._view.hide()
+            self._view.setParent(None)
+
+
+class PlotView(QWidget):
+    """
+    Tab of plot, which keeps JSON of figure and shows it in the view of PlotHost while visible.
+    """
 
     def __init__(self, figure):
         super().__init__()
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
         self.figure = figure
 
     @property
@@ -56,22 +274,16 @@ class PlotView(QWebEngineView):
     @figure.setter
     def figure(self, figure):
         self._figure = figure
-        if figure is not None:
-            if not os.path.isfile(utils.PATH.PLOTLY_JS):
-                plotly.offline.plot(figure, filename=utils.PATH.PLOT, include_plotlyjs=True, auto_open=False)
-                self.load(QUrl.fromLocalFile(utils.PATH.PLOT))
-            else:
-                self.setHtml(f"""
-                <html>
-                    <head><meta charset="utf-8"></head>
-                    <body>
-                        {plotly.offline.plot(figure,
-                                             output_type='div',
-                                             include_plotlyjs=os.path.relpath(
-                                                 utils.PATH.PLOTLY_JS, os.path.dirname(utils.PATH.PLOT)
-                                             ))}
-                    </body>
-                </html>
-                """, QUrl.fromLocalFile(utils.PATH.PLOT))
-        else:
-            self.setHtml(f"<html><body></body></html>")
+        self.figure_json = plotly.io.to_json(figure, validate=False) if figure is not None else "null"
+        if self.isVisible():
+            PlotHost.instance().show(self)
+
+    def showEvent(self, event: QShowEvent):
+        super().showEvent(event)
+        PlotHost.instance().show(self)
+
+    def hideEvent(self, event: QHideEvent):
+        super().hideEvent(event)
+        # View stays in minimized window
+        if not event.spontaneous():
+            PlotHost.instance().hide(self)